@@ -1,10 +1,29 @@
-import requests, time, json, re
+import requests, time, json, re, csv, io, gzip, bz2, codecs, zipfile
+import os, sys, sqlite3, threading, random, argparse, contextlib, functools, inspect, tempfile
+from collections import deque
+from itertools import compress, islice
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from geopy.geocoders import Nominatim, ArcGIS, GoogleV3
 from geopy.distance import geodesic
-from shapely import wkt
-from shapely.geometry import Point, shape, Polygon
+from geopy.adapters import RequestsAdapter
+from geopy.exc import GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable
+import shapely
+from shapely import wkt, wkb
+from shapely.geometry import Point, shape, Polygon, MultiPolygon, mapping, box
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+import numpy as np
 from xml.etree import ElementTree
 
+try:
+    import osmium
+except ImportError:
+    osmium = None
+
 
 #### REQUIREMENT FOR USE ####
 # Obtain a Google Cloud "Google Places" API Key
@@ -27,6 +46,145 @@ EXCLUDE_SEARCH_TYPES = ["university"]
 #SEARCH_KEYWORDS = ["School", "Academy", "Child", "Kid"]
 SEARCH_KEYWORDS = ["Child", "Kid"]
 
+# Geocoding results are cached on disk so repeated runs don't hit the geocoders again
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+GEOCODE_CACHE_ENABLED = True
+GEOCODE_CACHE_TTL_DAYS = 90
+GEOCODE_CACHE_NEGATIVE_TTL_DAYS = 7
+
+# Option 2 screens restaurants in parallel; each provider is throttled to the
+# given number of requests per second (Nominatim's usage policy is 1 req/s)
+SCREENING_WORKERS = 8
+PROVIDER_RATE_LIMITS = {
+    "google_places": 10,
+    "arcgis": 5,
+    "nominatim": 1,
+    "census": 5,
+    "overpass": 0.5,
+}
+
+# Shared HTTP transport: per-provider timeouts (seconds) and retry policy.
+# Retries use jittered exponential backoff and honor Retry-After headers.
+HTTP_TIMEOUTS = {
+    "google_places": 10,
+    "arcgis": 10,
+    "nominatim": 10,
+    "census": 10,
+    "overpass": 60,
+}
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_BASE_SECONDS = 1
+HTTP_BACKOFF_MAX_SECONDS = 60
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+NOMINATIM_USER_AGENT = "shelby_locator"
+
+# Base URL of every upstream service. 'bench-record'/'bench-replay' point these
+# at a local stand-in server so runs need no network access or API key.
+PROVIDER_BASE_URLS = {
+    "google_places": "https://places.googleapis.com",
+    "overpass": "https://overpass-api.de",
+    "census": "https://geocoding.geo.census.gov",
+    "arcgis": "https://geocode.arcgis.com",
+    "nominatim": "https://nominatim.openstreetmap.org",
+}
+
+# Forward geocoding is hedged: the next provider in order is started whenever
+# the ones already running have not answered within the slowest one's observed
+# p95 latency, and the first in-county answer wins. GEOCODE_CONSENSUS waits for
+# every provider instead and flags answers that disagree by more than
+# GEOCODE_CONSENSUS_FEET.
+GEOCODE_HEDGING = True
+GEOCODE_HEDGE_DEFAULT_DELAY = 2.0
+GEOCODE_HEDGE_MIN_DELAY = 0.25
+GEOCODE_LATENCY_SAMPLES = 200
+GEOCODE_CONSENSUS = False
+GEOCODE_CONSENSUS_FEET = 500
+
+# Run metrics: stage timers, per-provider call/error/retry counts and latency
+# histograms (upper bounds in seconds). Written as JSON and/or a Prometheus
+# textfile when a path is set (or --metrics-json / --metrics-prom are given).
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRICS_JSON_PATH = None
+METRICS_PROMETHEUS_PATH = None
+
+# Places API budget: hard stop per run and per calendar day, with a warning at
+# PLACES_BUDGET_WARN_FRACTION of either limit. Responses are cached on disk for
+# PLACES_CACHE_TTL_DAYS so repeated or resumed scans don't pay twice.
+PLACES_BUDGET_PER_RUN = 2000
+PLACES_BUDGET_PER_DAY = 9000
+PLACES_BUDGET_WARN_FRACTION = 0.8
+PLACES_CACHE_ENABLED = True
+PLACES_CACHE_TTL_DAYS = 30
+# estimated USD per 1000 requests for the field masks used below
+PLACES_COST_PER_1000 = {"nearby": 32.0, "text": 35.0}
+
+# Long scans write each verdict to a journal so they can be resumed after a
+# crash, quota stop or Ctrl-C; writes are fsync'd in batches
+SCAN_JOURNAL_DIR = os.path.join(CACHE_DIR, "scan")
+JOURNAL_FSYNC_EVERY = 50
+JOURNAL_FSYNC_SECONDS = 5
+
+# Incremental scans keep the previous run's restaurants, prohibited sites and
+# verdicts, and only rescreen what changed; a restaurant counts as moved when
+# its coordinates shift by more than INCREMENTAL_MOVE_FEET
+INCREMENTAL_STATE_PATH = os.path.join(CACHE_DIR, "incremental_state.json")
+INCREMENTAL_MOVE_FEET = 50
+
+# Without a site index, option 2 groups restaurants on a CLUSTER_CELL_FEET grid
+# and issues one covering search per group instead of one per restaurant
+CLUSTER_SCREENING = True
+CLUSTER_CELL_FEET = 1000
+CLUSTER_MAX_MEMBERS = 25
+
+# Google Places returns at most 20 results per request; saturated searches are
+# split into smaller covering circles down to this radius
+PLACES_MAX_RESULTS = 20
+PLACES_MIN_SPLIT_RADIUS_METERS = 50
+# Text Search is only biased toward the circle, so its splits are capped at this depth
+PLACES_TEXT_MAX_SPLIT_DEPTH = 2
+
+# Census batch geocoder: at most 10,000 addresses per uploaded file
+CENSUS_BATCH_SIZE = 10000
+CENSUS_BATCH_WORKERS = 2
+CENSUS_BATCH_TIMEOUT = 600
+
+# County-wide index of prohibited sites, harvested once (menu option 3) and
+# then used for local radius queries instead of per-address Places calls.
+# The index is ignored once it is older than SITE_INDEX_MAX_AGE_DAYS.
+SITE_INDEX_SOURCES = ["overpass", "places"]
+SITE_INDEX_MAX_AGE_DAYS = 30
+SITE_HARVEST_TILE_RADIUS_METERS = 1500
+
+# County boundaries are kept in a local registry keyed by FIPS code. They are
+# downloaded once from the Census cartographic boundary file (KML, 1:500k) and
+# stored as WKB; COUNTY_OVERRIDES replaces the downloaded boundary for a county
+# (Shelby's is hand-adjusted, see polygon_wkt below).
+DEFAULT_COUNTY_FIPS = "47157"
+COUNTY_BOUNDARIES_URL = "https://www2.census.gov/geo/tiger/GENZ2023/kml/cb_2023_us_county_500k.zip"
+COUNTY_REGISTRY_DIR = os.path.join(CACHE_DIR, "counties")
+COUNTY_SIMPLIFY_DEGREES = 0.001
+
+# A local dataset ingested from an OSM extract (ingest-osm); when present it is
+# used instead of live Overpass queries
+OSM_OFFLINE_DATASET = os.path.join(CACHE_DIR, "osm_extract.jsonl.gz")
+USE_OSM_OFFLINE_DATASET = True
+
+# OSM tags that correspond to SEARCH_TYPES / EXCLUDE_SEARCH_TYPES
+OSM_YOUTH_TAGS = {
+    "park": [("leisure", "park")],
+    "playground": [("leisure", "playground")],
+    "school": [("amenity", "school")],
+    "library": [("amenity", "library")],
+    "preschool": [("amenity", "kindergarten")],
+    "sports_complex": [("leisure", "sports_centre"), ("leisure", "stadium")],
+    "sports_activity_location": [("leisure", "pitch"), ("leisure", "track")],
+    "fitness_center": [("leisure", "fitness_centre")],
+    "child_care_agency": [("amenity", "childcare")],
+    "video_arcade": [("leisure", "amusement_arcade")],
+    "swimming_pool": [("leisure", "water_park"), ("leisure", "swimming_pool")],
+    "university": [("amenity", "university"), ("amenity", "college")],
+}
+
 # ---------------------------
 # AUTO DOWNLOAD COUNTY BOUNDARY
 # ---------------------------
@@ -78,9 +236,352 @@ POLYGON ((-89.642786 35.04486, -89.643782 35.012092, -89.643739 35.011693,
 
 # Parse WKT to Polygon object
 shelby_polygon = wkt.loads(polygon_wkt)
+# build the polygon's edge index once so repeated containment tests are fast
+shapely.prepare(shelby_polygon)
 #print("shelby_polygon: ")
 #print(shelby_polygon)
 
+COUNTY_OVERRIDES = {DEFAULT_COUNTY_FIPS: polygon_wkt}
+
+
+# ---------------------------
+# COUNTY REGISTRY
+# ---------------------------
+
+class County:
+    """A county boundary with exact geometry plus simplified outer/inner versions for fast point tests."""
+
+    def __init__(self, fips, name, exact, outer=None, inner=None):
+        self.fips = fips
+        self.name = name
+        self.exact = exact
+        if outer is None:
+            # buffer by the simplify tolerance first so the outer stays a superset and the inner a subset
+            outer = exact.buffer(COUNTY_SIMPLIFY_DEGREES).simplify(COUNTY_SIMPLIFY_DEGREES)
+            inner = exact.buffer(-COUNTY_SIMPLIFY_DEGREES).simplify(COUNTY_SIMPLIFY_DEGREES)
+        self.outer = outer
+        self.inner = inner
+        for geom in (self.exact, self.outer, self.inner):
+            shapely.prepare(geom)
+
+    def contains(self, lats, lngs):
+        """Boolean array of which points are inside the county.
+
+        Points inside the simplified inner boundary or outside the simplified
+        outer boundary are decided without touching the exact geometry.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        inside = points_in_polygon(self.outer, lats, lngs)
+        if inside.any() and not self.inner.is_empty:
+            sure = np.zeros_like(inside)
+            sure[inside] = shapely.contains_xy(self.inner, lngs[inside], lats[inside])
+            unsure = inside & ~sure
+        else:
+            unsure = inside
+        if unsure.any():
+            inside[unsure] = shapely.contains_xy(self.exact, lngs[unsure], lats[unsure])
+        return inside
+
+
+class CountyRegistry:
+    """Lazily loaded county boundaries stored as WKB under COUNTY_REGISTRY_DIR, keyed by 5-digit FIPS."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or COUNTY_REGISTRY_DIR
+        self.counties = {}
+        self.lock = threading.Lock()
+
+    def _path(self, fips, kind="exact"):
+        return os.path.join(self.directory, f"{fips}.{kind}.wkb")
+
+    def _names(self):
+        path = os.path.join(self.directory, "index.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, county, names):
+        os.makedirs(self.directory, exist_ok=True)
+        for kind, geom in (("exact", county.exact), ("outer", county.outer), ("inner", county.inner)):
+            with open(self._path(county.fips, kind), "wb") as f:
+                f.write(wkb.dumps(geom))
+        names[county.fips] = county.name
+
+    def _save_names(self, names):
+        with open(os.path.join(self.directory, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(names, f, indent=0, sort_keys=True)
+
+    def fetch_all(self):
+        """Download every US county boundary once and store each as WKB."""
+        print("Downloading county boundaries ...")
+        archive = zipfile.ZipFile(io.BytesIO(http_request("GET", COUNTY_BOUNDARIES_URL, timeout=300).content))
+        kml_name = next(name for name in archive.namelist() if name.endswith(".kml"))
+        names = self._names()
+        with archive.open(kml_name) as kml:
+            for fips, name, geom in iter_census_kml_counties(kml):
+                if fips in COUNTY_OVERRIDES:
+                    continue
+                if not geom.is_valid:
+                    geom = geom.buffer(0)
+                self._write(County(fips, name or fips, geom), names)
+        self._save_names(names)
+        print(f"Stored {len(names)} county boundaries in {self.directory}")
+
+    def import_boundary(self, fips, geom, name=None):
+        """Store a boundary from a file or WKT for one county (e.g. a full-resolution TIGER multipolygon)."""
+        with self.lock:
+            names = self._names()
+            county = County(fips, name or names.get(fips, fips), geom)
+            self._write(county, names)
+            self._save_names(names)
+            self.counties[fips] = county
+            return county
+
+    def get(self, fips):
+        """Return the County for a FIPS code, loading (or downloading) it on first use."""
+        fips = str(fips).zfill(5)
+        with self.lock:
+            county = self.counties.get(fips)
+            if county is not None:
+                return county
+            if fips in COUNTY_OVERRIDES and not os.path.exists(self._path(fips)):
+                county = County(fips, self._names().get(fips, fips), wkt.loads(COUNTY_OVERRIDES[fips]))
+            else:
+                if not os.path.exists(self._path(fips)):
+                    self.fetch_all()
+                if not os.path.exists(self._path(fips)):
+                    raise ValueError(f"County {fips} not found in the boundary dataset")
+                geoms = []
+                for kind in ("exact", "outer", "inner"):
+                    with open(self._path(fips, kind), "rb") as f:
+                        geoms.append(wkb.loads(f.read()))
+                county = County(fips, self._names().get(fips, fips), *geoms)
+            self.counties[fips] = county
+            return county
+
+    def state_counties(self, state_fips):
+        """FIPS codes of every county in a state (2-digit state FIPS)."""
+        names = self._names()
+        if not names:
+            self.fetch_all()
+            names = self._names()
+        state_fips = str(state_fips).zfill(2)
+        return sorted(set(f for f in names if f.startswith(state_fips)) |
+                      set(f for f in COUNTY_OVERRIDES if f.startswith(state_fips)))
+
+    def locate(self, lats, lngs, fips_list):
+        """FIPS code of the county containing each point (first match in fips_list), or "" if none."""
+        lats = np.asarray(lats, dtype=float)
+        result = np.full(lats.shape, "", dtype=object)
+        for fips in fips_list:
+            unassigned = result == ""
+            if not unassigned.any():
+                break
+            inside = np.zeros(lats.shape, dtype=bool)
+            inside[unassigned] = self.get(fips).contains(lats[unassigned], np.asarray(lngs, dtype=float)[unassigned])
+            result[inside] = fips
+        return result
+
+
+def iter_census_kml_counties(kml):
+    """Yield (fips, name, geometry) for each county Placemark of a Census cartographic boundary KML."""
+    ns = "{http://www.opengis.net/kml/2.2}"
+
+    def ring(coordinates):
+        return [tuple(float(v) for v in point.split(",")[:2]) for point in coordinates.text.split()]
+
+    for _, elem in ElementTree.iterparse(kml):
+        if elem.tag != ns + "Placemark":
+            continue
+        fields = {data.get("name"): data.text for data in elem.iter(ns + "SimpleData")}
+        polygons = []
+        for poly in elem.iter(ns + "Polygon"):
+            outer = poly.find(f"{ns}outerBoundaryIs/{ns}LinearRing/{ns}coordinates")
+            holes = poly.findall(f"{ns}innerBoundaryIs/{ns}LinearRing/{ns}coordinates")
+            polygons.append(Polygon(ring(outer), [ring(hole) for hole in holes]))
+        if polygons and fields.get("GEOID"):
+            yield fields["GEOID"], fields.get("NAME"), polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+        elem.clear()
+
+
+county_registry = CountyRegistry()
+
+
+
+# ---------------------------
+# METRICS
+# ---------------------------
+
+class Metrics:
+    """Thread-safe run metrics: stage timers, named counters and per-provider request statistics.
+
+    Stage times are inclusive, so a stage that runs inside another (e.g.
+    distance computation during a county scan) is counted in both.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.providers = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.add_stage_time(name, time.perf_counter() - start, calls=1, errors=int(failed))
+
+    def add_stage_time(self, name, seconds, calls=0, errors=0):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"calls": 0, "errors": 0, "seconds": 0.0})
+            stage["calls"] += calls
+            stage["errors"] += errors
+            stage["seconds"] += seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _provider(self, provider):
+        stats = self.providers.get(provider)
+        if stats is None:
+            stats = self.providers[provider] = {"calls": 0, "errors": 0, "retries": 0, "seconds": 0.0,
+                                                "buckets": [0] * (len(METRICS_LATENCY_BUCKETS) + 1)}
+        return stats
+
+    def provider_call(self, provider, seconds, error=False):
+        """Record one upstream request attempt and its latency."""
+        slot = next((i for i, bound in enumerate(METRICS_LATENCY_BUCKETS) if seconds <= bound),
+                    len(METRICS_LATENCY_BUCKETS))
+        with self.lock:
+            stats = self._provider(provider)
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["seconds"] += seconds
+            stats["buckets"][slot] += 1
+
+    def provider_retry(self, provider):
+        with self.lock:
+            self._provider(provider)["retries"] += 1
+
+    def summary(self):
+        """JSON-ready snapshot of everything recorded so far."""
+        with self.lock:
+            stages = {name: dict(stage, seconds=round(stage["seconds"], 4)) for name, stage in self.stages.items()}
+            providers = {}
+            for name, stats in self.providers.items():
+                bounds = [str(b) for b in METRICS_LATENCY_BUCKETS] + ["+Inf"]
+                providers[name] = {"calls": stats["calls"], "errors": stats["errors"], "retries": stats["retries"],
+                                   "seconds": round(stats["seconds"], 4),
+                                   "latency_histogram": dict(zip(bounds, stats["buckets"]))}
+            counters = dict(self.counters)
+        return {"started": self.started, "elapsed_seconds": round(time.time() - self.started, 3),
+                "stages": stages, "providers": providers, "counters": counters,
+                "places": {"calls": dict(PLACES_STATS["calls"]), "cache_hits": PLACES_STATS["cache_hits"],
+                           "reused": PLACES_STATS["reused"], "budget_per_run": PLACES_BUDGET_PER_RUN,
+                           "budget_per_day": PLACES_BUDGET_PER_DAY},
+                "geocode_cache": dict(GEOCODE_CACHE_STATS)}
+
+    def prometheus_text(self):
+        """The summary in the Prometheus text exposition format."""
+        data = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP findsafe_{name} {help_text}")
+            lines.append(f"# TYPE findsafe_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"findsafe_{name}{{{label_text}}} {value}" if label_text else f"findsafe_{name} {value}")
+
+        stages = data["stages"].items()
+        metric("stage_calls_total", "counter", "Calls of each pipeline stage.",
+               [({"stage": n}, s["calls"]) for n, s in stages])
+        metric("stage_errors_total", "counter", "Stage calls that raised.",
+               [({"stage": n}, s["errors"]) for n, s in stages])
+        metric("stage_seconds_total", "counter", "Inclusive time spent in each stage.",
+               [({"stage": n}, s["seconds"]) for n, s in stages])
+        providers = data["providers"].items()
+        metric("provider_requests_total", "counter", "Upstream request attempts per provider.",
+               [({"provider": n}, p["calls"]) for n, p in providers])
+        metric("provider_errors_total", "counter", "Failed upstream request attempts per provider.",
+               [({"provider": n}, p["errors"]) for n, p in providers])
+        metric("provider_retries_total", "counter", "Retried upstream requests per provider.",
+               [({"provider": n}, p["retries"]) for n, p in providers])
+        lines.append("# HELP findsafe_provider_latency_seconds Upstream request latency.")
+        lines.append("# TYPE findsafe_provider_latency_seconds histogram")
+        for name, p in providers:
+            cumulative = 0
+            for bound, n in p["latency_histogram"].items():
+                cumulative += n
+                lines.append(f'findsafe_provider_latency_seconds_bucket{{provider="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'findsafe_provider_latency_seconds_sum{{provider="{name}"}} {p["seconds"]}')
+            lines.append(f'findsafe_provider_latency_seconds_count{{provider="{name}"}} {p["calls"]}')
+        metric("events_total", "counter", "Named run counters.",
+               [({"event": n}, v) for n, v in data["counters"].items()])
+        metric("places_requests_total", "counter", "Google Places requests sent this run.",
+               [({"endpoint": e}, n) for e, n in data["places"]["calls"].items()])
+        metric("places_budget_per_day", "gauge", "Configured daily Places request budget.",
+               [({}, data["places"]["budget_per_day"])])
+        metric("run_elapsed_seconds", "gauge", "Seconds since the run started.", [({}, data["elapsed_seconds"])])
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path=None, prometheus_path=None):
+        """Write the JSON summary and/or Prometheus textfile (atomically, for textfile collectors)."""
+        for path, render in ((json_path, lambda: json.dumps(self.summary(), indent=2)),
+                             (prometheus_path, self.prometheus_text)):
+            if not path:
+                continue
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(render())
+            os.replace(path + ".tmp", path)
+
+
+METRICS = Metrics()
+
+
+def timed_stage(name):
+    """Decorator: time every call of the function (or every step of a generator) as the named stage."""
+    def decorate(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                METRICS.add_stage_time(name, 0.0, calls=1)
+                iterator = fn(*args, **kwargs)
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        METRICS.add_stage_time(name, time.perf_counter() - start)
+                        return
+                    except BaseException:
+                        METRICS.add_stage_time(name, time.perf_counter() - start, errors=1)
+                        raise
+                    METRICS.add_stage_time(name, time.perf_counter() - start)
+                    yield item
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with METRICS.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def write_metrics():
+    if METRICS_JSON_PATH or METRICS_PROMETHEUS_PATH:
+        METRICS.write(METRICS_JSON_PATH, METRICS_PROMETHEUS_PATH)
 
 
 # ---------------------------
@@ -93,13 +594,556 @@ def miles_to_feet(miles):
     return miles * 5280
 
 
+# ---------------------------
+# BATCH DISTANCES
+# ---------------------------
+
+try:
+    from pyproj import Geod
+    _wgs84_geod = Geod(ellps="WGS84")
+except ImportError:
+    _wgs84_geod = None
+
+EARTH_RADIUS_METERS = 6371008.8
+# haversine on a sphere is within ~0.5% of the ellipsoidal distance
+HAVERSINE_MAX_RELATIVE_ERROR = 0.006
+
+
+def haversine_meters(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters; arguments are scalars or NumPy-broadcastable arrays."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def geodesic_meters(lat1, lng1, lat2, lng2):
+    """Exact ellipsoidal distance in meters (pyproj if installed, else geopy one pair at a time)."""
+    lat1, lng1, lat2, lng2 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (lat1, lng1, lat2, lng2)))
+    if _wgs84_geod is not None:
+        return np.asarray(_wgs84_geod.inv(lng1, lat1, lng2, lat2)[2], dtype=float)
+    out = np.empty(lat1.shape)
+    for idx in np.ndindex(lat1.shape):
+        out[idx] = geodesic((lat1[idx], lng1[idx]), (lat2[idx], lng2[idx])).meters
+    return out
+
+
+@timed_stage("distance")
+def batch_distances_feet(lat1, lng1, lat2, lng2, threshold_feet=None, exact=False):
+    """Distances in feet between origins and targets (broadcast like NumPy).
+
+    By default a fast haversine is used. With threshold_feet, pairs whose
+    haversine distance is close enough to the threshold that the spherical
+    error could flip a <= comparison are recomputed with the exact geodesic,
+    so threshold decisions and rounding match geodesic(...).meters / 0.3048.
+    exact=True computes every pair with the exact geodesic.
+    """
+    if exact:
+        return geodesic_meters(lat1, lng1, lat2, lng2) / 0.3048
+    lat1, lng1, lat2, lng2 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (lat1, lng1, lat2, lng2)))
+    feet = haversine_meters(lat1, lng1, lat2, lng2) / 0.3048
+    if threshold_feet is not None:
+        near = np.abs(feet - threshold_feet) <= threshold_feet * HAVERSINE_MAX_RELATIVE_ERROR + 1
+        if near.any():
+            feet = feet.copy()
+            feet[near] = geodesic_meters(lat1[near], lng1[near], lat2[near], lng2[near]) / 0.3048
+    return feet
+
+
+def benchmark_distances(sizes=(10_000, 1_000_000), loop_sample=20_000):
+    """Compare the old per-pair geodesic loop against the batch engine.
+
+    The per-pair loop is timed on at most loop_sample pairs and extrapolated
+    for larger sizes, since 1M Karney solves take minutes.
+    """
+    rng = np.random.default_rng(0)
+    min_lng, min_lat, max_lng, max_lat = shelby_polygon.bounds
+    for n in sizes:
+        lat1 = rng.uniform(min_lat, max_lat, n)
+        lng1 = rng.uniform(min_lng, max_lng, n)
+        lat2 = lat1 + rng.uniform(-0.01, 0.01, n)
+        lng2 = lng1 + rng.uniform(-0.01, 0.01, n)
+
+        sample = min(n, loop_sample)
+        start = time.perf_counter()
+        loop_ft = np.array([geodesic((lat1[i], lng1[i]), (lat2[i], lng2[i])).meters / 0.3048 for i in range(sample)])
+        loop_seconds = (time.perf_counter() - start) * n / sample
+
+        start = time.perf_counter()
+        hav_ft = batch_distances_feet(lat1, lng1, lat2, lng2)
+        hav_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        thr_ft = batch_distances_feet(lat1, lng1, lat2, lng2, threshold_feet=RADIUS_FEET)
+        thr_seconds = time.perf_counter() - start
+
+        loop_inside = np.rint(loop_ft) <= RADIUS_FEET
+        mismatches = int(np.sum((np.rint(thr_ft[:sample]) <= RADIUS_FEET) != loop_inside))
+        max_err = float(np.max(np.abs(hav_ft[:sample] - loop_ft) / np.maximum(loop_ft, 1)))
+
+        estimated = " (extrapolated)" if sample < n else ""
+        print(f"{n:>9,} pairs: per-pair geodesic {loop_seconds:8.3f}s{estimated} | "
+              f"haversine {hav_seconds:7.4f}s | threshold-exact {thr_seconds:7.4f}s | "
+              f"haversine max rel. error {max_err:.4%} | threshold mismatches {mismatches}")
+
+
+# ---------------------------
+# RATE LIMITING
+# ---------------------------
+
+class RateLimiter:
+    """Thread-safe token bucket: allows `rate` calls per second with bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def rate_limit(provider):
+    """Block until the named provider's token bucket allows another request."""
+    rate = PROVIDER_RATE_LIMITS.get(provider)
+    if not rate:
+        return
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(provider)
+        if limiter is None:
+            limiter = _rate_limiters[provider] = RateLimiter(rate)
+    limiter.acquire()
+
+
+# ---------------------------
+# HTTP TRANSPORT
+# ---------------------------
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def provider_url(provider, path):
+    """Full URL for a path on a provider, honoring PROVIDER_BASE_URLS overrides."""
+    return PROVIDER_BASE_URLS[provider].rstrip("/") + path
+
+
+def http_session(url):
+    """Return the pooled keep-alive session for the URL's host, creating it on first use."""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(10, SCREENING_WORKERS * 2))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def retry_after_seconds(response):
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP-date), or None."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt, base=None):
+    """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+    base = HTTP_BACKOFF_BASE_SECONDS if base is None else base
+    return random.uniform(0, min(HTTP_BACKOFF_MAX_SECONDS, base * 2 ** attempt))
+
+
+def http_request(method, url, provider=None, timeout=None, max_retries=None, backoff_base=None, **kwargs):
+    """Send a request through the shared session for the host, with rate limiting and retries.
+
+    Connection errors, timeouts and HTTP_RETRY_STATUSES are retried; the final
+    failure is raised as a requests.RequestException like requests itself would.
+    """
+    timeout = timeout or HTTP_TIMEOUTS.get(provider, 10)
+    max_retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+    session = http_session(url)
+    metrics_name = provider or urlsplit(url).netloc
+    for attempt in range(max_retries):
+        last_attempt = attempt == max_retries - 1
+        if provider:
+            rate_limit(provider)
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            METRICS.provider_call(metrics_name, time.perf_counter() - start, error=True)
+            if last_attempt:
+                raise
+            METRICS.provider_retry(metrics_name)
+            print(f"[WARN] {provider or url} attempt {attempt + 1} failed: {e}")
+            time.sleep(backoff_seconds(attempt, backoff_base))
+            continue
+        METRICS.provider_call(metrics_name, time.perf_counter() - start, error=response.status_code >= 400)
+        if response.status_code == 429:
+            METRICS.count(f"{metrics_name}_throttled")
+        if response.status_code in HTTP_RETRY_STATUSES and not last_attempt:
+            METRICS.provider_retry(metrics_name)
+            wait = retry_after_seconds(response)
+            if wait is None:
+                wait = backoff_seconds(attempt, backoff_base)
+            print(f"[WARN] {provider or url} returned HTTP {response.status_code}; retrying in {wait:.1f}s")
+            time.sleep(min(wait, HTTP_BACKOFF_MAX_SECONDS))
+            continue
+        response.raise_for_status()
+        return response
+
+
+_geocoders = {}
+_geocoders_lock = threading.Lock()
+
+
+def get_geocoder(provider):
+    """Return the shared geopy geocoder for 'arcgis' or 'nominatim' (one pooled session each)."""
+    with _geocoders_lock:
+        geocoder = _geocoders.get(provider)
+        if geocoder is None:
+            timeout = HTTP_TIMEOUTS.get(provider, 10)
+            base = urlsplit(PROVIDER_BASE_URLS.get(provider, ""))
+            # geopy takes the host (plus any path prefix) and scheme separately
+            location = {"scheme": base.scheme, "domain": base.netloc + base.path.rstrip("/")}
+            if provider == "arcgis":
+                geocoder = ArcGIS(timeout=timeout, adapter_factory=RequestsAdapter, **location)
+            elif provider == "nominatim":
+                geocoder = Nominatim(user_agent=NOMINATIM_USER_AGENT, timeout=timeout, adapter_factory=RequestsAdapter,
+                                     **location)
+            else:
+                raise ValueError(f"Unknown geocoder: {provider}")
+            _geocoders[provider] = geocoder
+        return geocoder
+
+
+def geopy_call(provider, fn, *args, **kwargs):
+    """Call a geopy geocoder method with rate limiting and the shared retry policy."""
+    for attempt in range(HTTP_MAX_RETRIES):
+        rate_limit(provider)
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except GeocoderRateLimited as e:
+            METRICS.provider_call(provider, time.perf_counter() - start, error=True)
+            METRICS.count(f"{provider}_throttled")
+            if attempt == HTTP_MAX_RETRIES - 1:
+                raise
+            METRICS.provider_retry(provider)
+            wait = e.retry_after if e.retry_after is not None else backoff_seconds(attempt)
+            time.sleep(min(wait, HTTP_BACKOFF_MAX_SECONDS))
+        except (GeocoderTimedOut, GeocoderUnavailable):
+            METRICS.provider_call(provider, time.perf_counter() - start, error=True)
+            if attempt == HTTP_MAX_RETRIES - 1:
+                raise
+            METRICS.provider_retry(provider)
+            time.sleep(backoff_seconds(attempt))
+        except Exception:
+            METRICS.provider_call(provider, time.perf_counter() - start, error=True)
+            raise
+        else:
+            METRICS.provider_call(provider, time.perf_counter() - start)
+            return result
+
+
+# ---------------------------
+# GEOCODE CACHE
+# ---------------------------
+
+class GeocodeNotFound(ValueError):
+    """Raised when a provider answered but had no match (safe to cache as a negative result)."""
+
+
+GEOCODE_CACHE_STATS = {"hits": 0, "misses": 0, "stores": 0}
+_geocode_cache_conn = None
+_geocode_cache_lock = threading.Lock()
+
+
+def _geocode_cache():
+    """Open (once) the SQLite geocode cache under CACHE_DIR."""
+    global _geocode_cache_conn
+    if _geocode_cache_conn is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(CACHE_DIR, "geocode.sqlite3"), check_same_thread=False)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocode (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                found INTEGER NOT NULL,
+                lat REAL,
+                lng REAL,
+                address TEXT,
+                provider TEXT,
+                created REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+        """)
+        # expired rows are never served, so drop them once per run to keep the file from growing forever
+        _delete_expired_geocodes(conn)
+        _geocode_cache_conn = conn
+    return _geocode_cache_conn
+
+
+def normalize_address_key(address):
+    """Normalize an address string so trivially different spellings share a cache entry."""
+    key = re.sub(r"[^\w\s]", " ", (address or "").casefold())
+    return re.sub(r"\s+", " ", key).strip()
+
+
+def coordinate_key(lat, lng):
+    """Cache key for a coordinate pair (6 decimals is ~10 cm)."""
+    return f"{float(lat):.6f},{float(lng):.6f}"
+
+
+def geocode_cache_get(kind, key):
+    """Return the cached row dict for (kind, key), or None on a miss or expired entry."""
+    if not GEOCODE_CACHE_ENABLED:
+        return None
+    with _geocode_cache_lock:
+        row = _geocode_cache().execute(
+            "SELECT found, lat, lng, address, provider, created FROM geocode WHERE kind = ? AND key = ?",
+            (kind, key)).fetchone()
+        if row is not None:
+            found, lat, lng, address, provider, created = row
+            ttl_days = GEOCODE_CACHE_TTL_DAYS if found else GEOCODE_CACHE_NEGATIVE_TTL_DAYS
+            if time.time() - created <= ttl_days * 86400:
+                GEOCODE_CACHE_STATS["hits"] += 1
+                return {"found": bool(found), "lat": lat, "lng": lng, "address": address, "provider": provider}
+        GEOCODE_CACHE_STATS["misses"] += 1
+        return None
+
+
+def geocode_cache_put(kind, key, found, lat=None, lng=None, address=None, provider=None):
+    """Store a positive (found=True) or negative (found=False) geocoding result."""
+    if not GEOCODE_CACHE_ENABLED:
+        return
+    with _geocode_cache_lock:
+        conn = _geocode_cache()
+        conn.execute(
+            "INSERT OR REPLACE INTO geocode (kind, key, found, lat, lng, address, provider, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, key, int(found), lat, lng, address, provider, time.time()))
+        conn.commit()
+        GEOCODE_CACHE_STATS["stores"] += 1
+
+
+def _delete_expired_geocodes(conn):
+    now = time.time()
+    conn.execute("DELETE FROM geocode WHERE found = 1 AND created < ?", (now - GEOCODE_CACHE_TTL_DAYS * 86400,))
+    conn.execute("DELETE FROM geocode WHERE found = 0 AND created < ?", (now - GEOCODE_CACHE_NEGATIVE_TTL_DAYS * 86400,))
+    conn.commit()
+
+
+def purge_geocode_cache():
+    """Delete expired entries from the geocode cache (also done each time the cache is opened)."""
+    with _geocode_cache_lock:
+        _delete_expired_geocodes(_geocode_cache())
+
+
+def cached_forward_geocode(kind, provider_fn):
+    """Wrap a forward geocoder so answers (and 'not found' answers) are served from the cache."""
+    def wrapper(address):
+        key = normalize_address_key(address)
+        cached = geocode_cache_get(kind, key)
+        if cached is not None:
+            if not cached["found"]:
+                raise GeocodeNotFound(f"Address not found via {kind} (cached)")
+            return (cached["lat"], cached["lng"])
+        try:
+            lat, lng = provider_fn(address)
+        except GeocodeNotFound:
+            geocode_cache_put(kind, key, False, provider=kind)
+            raise
+        geocode_cache_put(kind, key, True, lat, lng, provider=kind)
+        return (lat, lng)
+    wrapper.__name__ = provider_fn.__name__
+    wrapper.__doc__ = provider_fn.__doc__
+    wrapper.uncached = provider_fn
+    return wrapper
+
+
+def print_geocode_cache_stats():
+    stats = GEOCODE_CACHE_STATS
+    lookups = stats["hits"] + stats["misses"]
+    if lookups:
+        print(f"[CACHE] Geocode cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({100.0 * stats['hits'] / lookups:.0f}% hit rate)")
+
+
+# ---------------------------
+# PLACES BUDGET AND RESPONSE CACHE
+# ---------------------------
+
+class PlacesBudgetExceeded(RuntimeError):
+    """Raised instead of sending a Places request that would exceed the run or daily budget."""
+
+
+PLACES_STATS = {"calls": {"nearby": 0, "text": 0}, "cache_hits": 0, "reused": 0}
+_places_warned = set()
+_places_cache_conn = None
+_places_lock = threading.Lock()
+
+
+def _places_cache():
+    """Open (once) the SQLite Places response cache / usage ledger under CACHE_DIR."""
+    global _places_cache_conn
+    if _places_cache_conn is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(CACHE_DIR, "places.sqlite3"), check_same_thread=False)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS places_response (
+                endpoint TEXT NOT NULL,
+                query TEXT NOT NULL,
+                types TEXT NOT NULL,
+                lat REAL NOT NULL,
+                lng REAL NOT NULL,
+                radius REAL NOT NULL,
+                saturated INTEGER NOT NULL,
+                places TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (endpoint, query, types, lat, lng, radius)
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS places_usage (day TEXT PRIMARY KEY, calls INTEGER NOT NULL)")
+        # expired responses are never served, so drop them once per run as the geocode cache does
+        conn.execute("DELETE FROM places_response WHERE created < ?", (time.time() - PLACES_CACHE_TTL_DAYS * 86400,))
+        conn.commit()
+        _places_cache_conn = conn
+    return _places_cache_conn
+
+
+def _places_cache_key(endpoint, query, types, lat, lng, radius_meters):
+    # centers quantized to 1e-5 degrees (~1 m) and radii to 0.1 m
+    return (endpoint, query or "", ",".join(sorted(types or [])),
+            round(float(lat), 5), round(float(lng), 5), round(float(radius_meters), 1))
+
+
+def places_cache_lookup(endpoint, query, types, lat, lng, radius_meters):
+    """Return cached places for this request, or None.
+
+    Besides exact matches, a Nearby Search (a hard location restriction) can be
+    answered from any cached unsaturated response whose circle contains the
+    requested circle, by keeping only the places inside the smaller circle.
+    """
+    if not PLACES_CACHE_ENABLED:
+        return None
+    key = _places_cache_key(endpoint, query, types, lat, lng, radius_meters)
+    oldest = time.time() - PLACES_CACHE_TTL_DAYS * 86400
+    with _places_lock:
+        conn = _places_cache()
+        row = conn.execute(
+            "SELECT places FROM places_response WHERE endpoint = ? AND query = ? AND types = ? "
+            "AND lat = ? AND lng = ? AND radius = ? AND created >= ?", key + (oldest,)).fetchone()
+        if row is not None:
+            PLACES_STATS["cache_hits"] += 1
+            return json.loads(row[0])
+        if endpoint != "nearby":
+            return None
+        # cheap bbox prefilter in SQL, exact containment check below
+        rows = conn.execute(
+            "SELECT lat, lng, radius, places FROM places_response WHERE endpoint = ? AND query = ? AND types = ? "
+            "AND saturated = 0 AND created >= ? AND radius >= ? AND ABS(lat - ?) * 111320 <= radius - ? "
+            "ORDER BY radius LIMIT 50",
+            (key[0], key[1], key[2], oldest, key[5], key[3], key[5])).fetchall()
+    for c_lat, c_lng, c_radius, places_json in rows:
+        if float(haversine_meters(lat, lng, c_lat, c_lng)) + radius_meters > c_radius * (1 - HAVERSINE_MAX_RELATIVE_ERROR):
+            continue
+        places = [p for p in json.loads(places_json)
+                  if p.get("location", {}).get("latitude") is not None
+                  and float(haversine_meters(lat, lng, p["location"]["latitude"], p["location"]["longitude"]))
+                  <= radius_meters]
+        with _places_lock:
+            PLACES_STATS["reused"] += 1
+        return places
+    return None
+
+
+def places_cache_store(endpoint, query, types, lat, lng, radius_meters, places):
+    if not PLACES_CACHE_ENABLED:
+        return
+    key = _places_cache_key(endpoint, query, types, lat, lng, radius_meters)
+    with _places_lock:
+        conn = _places_cache()
+        conn.execute(
+            "INSERT OR REPLACE INTO places_response "
+            "(endpoint, query, types, lat, lng, radius, saturated, places, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            key + (int(len(places) >= PLACES_MAX_RESULTS), json.dumps(places), time.time()))
+        conn.commit()
+
+
+def places_calls_today():
+    with _places_lock:
+        row = _places_cache().execute("SELECT calls FROM places_usage WHERE day = ?",
+                                      (time.strftime("%Y-%m-%d"),)).fetchone()
+    return row[0] if row else 0
+
+
+def charge_places_request(endpoint):
+    """Count one billable Places request against the run and daily budgets, or raise PlacesBudgetExceeded."""
+    day = time.strftime("%Y-%m-%d")
+    with _places_lock:
+        conn = _places_cache()
+        row = conn.execute("SELECT calls FROM places_usage WHERE day = ?", (day,)).fetchone()
+        today = row[0] if row else 0
+        run = sum(PLACES_STATS["calls"].values())
+        if run >= PLACES_BUDGET_PER_RUN:
+            raise PlacesBudgetExceeded(f"Places budget for this run ({PLACES_BUDGET_PER_RUN} requests) is used up")
+        if today >= PLACES_BUDGET_PER_DAY:
+            raise PlacesBudgetExceeded(f"Places budget for today ({PLACES_BUDGET_PER_DAY} requests) is used up")
+        for label, used, limit in (("run", run + 1, PLACES_BUDGET_PER_RUN), ("day", today + 1, PLACES_BUDGET_PER_DAY)):
+            if used >= limit * PLACES_BUDGET_WARN_FRACTION and label not in _places_warned:
+                _places_warned.add(label)
+                print(f"[WARNING] {used} of {limit} Places requests used for this {label}.")
+        conn.execute("INSERT INTO places_usage (day, calls) VALUES (?, 1) "
+                     "ON CONFLICT(day) DO UPDATE SET calls = calls + 1", (day,))
+        conn.commit()
+        PLACES_STATS["calls"][endpoint] += 1
+
+
+def print_places_cost_report():
+    calls = PLACES_STATS["calls"]
+    total = sum(calls.values())
+    if not (total or PLACES_STATS["cache_hits"] or PLACES_STATS["reused"]):
+        return
+    cost = sum(calls[e] * PLACES_COST_PER_1000.get(e, 0) / 1000 for e in calls)
+    print(f"[CACHE] Places requests: {total} sent ({calls['nearby']} nearby, {calls['text']} text), "
+          f"{PLACES_STATS['cache_hits']} cache hits, {PLACES_STATS['reused']} answered from larger cached searches")
+    print(f"[CACHE] Estimated Places cost this run: ${cost:.2f}; "
+          f"{places_calls_today()} of {PLACES_BUDGET_PER_DAY} daily requests used")
+
+
 # ---------------------------
 # ADDRESS UTILS
 # ---------------------------
 
 def census_geocode(address):
     """Try to geocode using U.S. Census API (best for U.S. addresses)."""
-    url = "https://geocoding.geo.census.gov/geocoder/locations/onelineaddress"
+    url = provider_url("census", "/geocoder/locations/onelineaddress")
 
     params = {
         "address": address,
@@ -109,47 +1153,316 @@ def census_geocode(address):
 
 
     try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
+        resp = http_request("GET", url, provider="census", params=params)
         result = resp.json()
         coords = result['result']['addressMatches'][0]['coordinates']
         return (coords['y'], coords['x'])  # latitude, longitude
 
-    except (IndexError, KeyError, requests.RequestException):
+    except IndexError:
+        raise GeocodeNotFound("Address not found via Census API")
+    except (KeyError, requests.RequestException):
         raise ValueError("Address not found via Census API")
 
 
 
 def arcgis_geocode(address):
     """Fallback geocoding using ArcGIS via geopy."""
-    geolocator = ArcGIS(timeout=10)
-    location = geolocator.geocode(address)
+    geolocator = get_geocoder("arcgis")
+    location = geopy_call("arcgis", geolocator.geocode, address)
 
     if location:
         return (location.latitude, location.longitude)
     else:
-        raise ValueError("Address not found via ArcGIS")
+        raise GeocodeNotFound("Address not found via ArcGIS")
 
 
 def nominatim_geocode(address):
     """Fallback geocoding using Nominatim."""
-    geolocator = Nominatim(user_agent="shelby_locator", timeout=10)
-    location = geolocator.geocode(address)
+    geolocator = get_geocoder("nominatim")
+    location = geopy_call("nominatim", geolocator.geocode, address)
 
     if location:
         return (location.latitude, location.longitude)
     else:
-        raise ValueError("Address not found via Nominatim")
+        raise GeocodeNotFound("Address not found via Nominatim")
+
+
+def split_one_line_address(address):
+    """Split '123 Main St, Memphis, TN 38103' into (street, city, state, zip) for the Census batch file."""
+    parts = [p.strip() for p in address.split(",") if p.strip()]
+    street, city, state, zipcode = address.strip(), "", "", ""
+    if len(parts) >= 2:
+        street = parts[0]
+        tail = parts[-1]
+        match = re.match(r"^([A-Za-z]{2})\s*(\d{5}(?:-\d{4})?)?$", tail)
+        if match:
+            state, zipcode = match.group(1), match.group(2) or ""
+            city = parts[-2] if len(parts) >= 3 else ""
+        elif re.fullmatch(r"\d{5}(?:-\d{4})?", tail) and len(parts) >= 3:
+            zipcode = tail
+            state = parts[-2]
+            city = parts[-3] if len(parts) >= 4 else ""
+        else:
+            city = parts[1]
+            state = parts[2] if len(parts) >= 3 else ""
+    return street, city, state, zipcode
+
+
+def census_batch_request(rows):
+    """Submit one batch file of (id, address) rows and yield (id, (lat, lng) or None) as the CSV streams back."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row_id, address in rows:
+        writer.writerow([row_id, *split_one_line_address(address)])
+    files = {"addressFile": ("addresses.csv", buf.getvalue().encode("utf-8"), "text/csv")}
+    response = http_request("POST", provider_url("census", "/geocoder/locations/addressbatch"), provider="census", timeout=CENSUS_BATCH_TIMEOUT,
+                            data={"benchmark": "Public_AR_Current"}, files=files, stream=True)
+    response.encoding = response.encoding or "utf-8"
+    with response:
+        for record in csv.reader(response.iter_lines(decode_unicode=True)):
+            if len(record) < 3:
+                continue
+            row_id, status = record[0], record[2]
+            coords = None
+            if status == "Match" and len(record) >= 6 and record[5]:
+                lng, lat = (float(v) for v in record[5].split(","))
+                coords = (lat, lng)
+            yield row_id, coords
+
+
+@timed_stage("forward_geocode_batch")
+def batch_geocode_addresses(addresses, chunk_size=None, workers=None):
+    """Forward-geocode many addresses, using the Census batch endpoint for everything not already cached.
+
+    Rows the Census batch geocoder can't match fall back to ArcGIS and
+    Nominatim. Returns a list aligned with the input of (lat, lng) or None.
+    """
+    chunk_size = min(chunk_size or CENSUS_BATCH_SIZE, CENSUS_BATCH_SIZE)
+    workers = workers or CENSUS_BATCH_WORKERS
+    results = [None] * len(addresses)
+
+    pending = []
+    for idx, address in enumerate(addresses):
+        cached = geocode_cache_get("forward", normalize_address_key(address))
+        if cached is not None:
+            results[idx] = (cached["lat"], cached["lng"]) if cached["found"] else None
+        else:
+            pending.append(idx)
+
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    unmatched = []
+    if chunks:
+        print(f"Submitting {len(pending)} addresses to the Census batch geocoder in {len(chunks)} file(s) ...")
+
+    def run_chunk(chunk):
+        return list(census_batch_request([(str(idx), addresses[idx]) for idx in chunk]))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(run_chunk, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                answered = dict(future.result())
+            except requests.RequestException as e:
+                print(f"[WARN] Census batch request failed ({e}); falling back for {len(chunk)} addresses")
+                answered = {}
+            for idx in chunk:
+                coords = answered.get(str(idx))
+                key = normalize_address_key(addresses[idx])
+                if coords is None:
+                    if str(idx) in answered:
+                        geocode_cache_put("census", key, False, provider="census")
+                    unmatched.append(idx)
+                    continue
+                geocode_cache_put("census", key, True, coords[0], coords[1], provider="census")
+                geocode_cache_put("forward", key, True, coords[0], coords[1], provider="census")
+                results[idx] = coords
+
+    if unmatched:
+        print(f"Geocoding {len(unmatched)} addresses the Census batch geocoder could not match ...")
+
+    def fallback(idx):
+        for method in (arcgis_geocode, nominatim_geocode):
+            try:
+                return method(addresses[idx])
+            except Exception:
+                continue
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, SCREENING_WORKERS)) as pool:
+        for idx, coords in zip(unmatched, pool.map(fallback, unmatched)):
+            if coords is not None:
+                geocode_cache_put("forward", normalize_address_key(addresses[idx]), True,
+                                  coords[0], coords[1], provider="fallback")
+            results[idx] = coords
+
+    return results
+
+
+GEOCODE_LATENCY = {}
+_geocode_latency_lock = threading.Lock()
+
+
+def timed_geocode(kind, provider_fn):
+    """Wrap a provider so the latency of each real (uncached) call is recorded for hedging."""
+    def wrapper(address):
+        start = time.monotonic()
+        try:
+            return provider_fn(address)
+        finally:
+            with _geocode_latency_lock:
+                samples = GEOCODE_LATENCY.setdefault(kind, deque(maxlen=GEOCODE_LATENCY_SAMPLES))
+                samples.append(time.monotonic() - start)
+    wrapper.__name__ = provider_fn.__name__
+    wrapper.__doc__ = provider_fn.__doc__
+    return wrapper
+
+
+def geocode_hedge_delay(kind):
+    """Seconds to wait on a provider before starting the next one: its p95 latency so far."""
+    with _geocode_latency_lock:
+        samples = sorted(GEOCODE_LATENCY.get(kind, ()))
+    if len(samples) < 5:
+        return GEOCODE_HEDGE_DEFAULT_DELAY
+    return max(GEOCODE_HEDGE_MIN_DELAY, samples[int(0.95 * (len(samples) - 1))])
+
+
+census_geocode = cached_forward_geocode("census", timed_geocode("census", census_geocode))
+arcgis_geocode = cached_forward_geocode("arcgis", timed_geocode("arcgis", arcgis_geocode))
+nominatim_geocode = cached_forward_geocode("nominatim", timed_geocode("nominatim", nominatim_geocode))
+
+GEOCODE_PROVIDERS = [("arcgis", arcgis_geocode), ("nominatim", nominatim_geocode), ("census", census_geocode)]
 
 
 def geocode_address(address):
-    """Attempt geocoding using multiple services in order."""
-    for method in [arcgis_geocode, nominatim_geocode, census_geocode]:
+    """Attempt geocoding using multiple services (hedged in parallel unless GEOCODE_HEDGING is off)."""
+    return geocode_address_details(address)["coords"]
+
+
+@timed_stage("forward_geocode")
+def geocode_address_details(address):
+    """Geocode an address and report which provider answered.
+
+    Returns a dict with "coords", "provider" and, in consensus mode,
+    "disagreement_feet" (largest distance between providers' answers) and
+    "flagged" when that exceeds GEOCODE_CONSENSUS_FEET. Concurrent lookups of
+    the same address share one set of provider calls.
+    """
+    return _geocode_flight.do(normalize_address_key(address), _geocode_address_details, address)
+
+
+def _geocode_address_details(address):
+    key = normalize_address_key(address)
+    cached = geocode_cache_get("forward", key)
+    if cached is not None and not GEOCODE_CONSENSUS:
+        if cached["found"]:
+            return {"coords": (cached["lat"], cached["lng"]), "provider": cached["provider"]}
+        raise ValueError("Failed to geocode address with all methods. (cached)")
+
+    if GEOCODE_HEDGING or GEOCODE_CONSENSUS:
+        result = hedged_geocode(address, consensus=GEOCODE_CONSENSUS)
+    else:
+        result = sequential_geocode(address)
+    if result["coords"] is not None:
+        lat, lng = result["coords"]
+        geocode_cache_put("forward", key, True, lat, lng, provider=result["provider"])
+        return result
+    # only remember the failure if every provider actually answered "no match"
+    if result["all_not_found"]:
+        geocode_cache_put("forward", key, False, provider="none")
+    raise ValueError("Failed to geocode address with all methods.")
+
+
+def sequential_geocode(address):
+    """Try each provider in GEOCODE_PROVIDERS order until one answers."""
+    all_not_found = True
+    for kind, method in GEOCODE_PROVIDERS:
         try:
-            return method(address)
+            return {"coords": method(address), "provider": kind}
+        except GeocodeNotFound:
+            continue
         except Exception:
+            all_not_found = False
             continue
-    raise ValueError("Failed to geocode address with all methods.")
+    return {"coords": None, "provider": None, "all_not_found": all_not_found}
+
+
+def geocode_in_service_area(lat, lng):
+    """True if the point is inside Shelby County or any county loaded for this run."""
+    if inside_shelby_county(lat, lng):
+        return True
+    return any(bool(c.contains([lat], [lng])[0]) for c in list(county_registry.counties.values()))
+
+
+def hedged_geocode(address, providers=None, consensus=False):
+    """Race the providers: start them in order, each after the previous ones' p95 delay, and take the
+    first in-county answer. A "not found" or error starts the next provider at once.
+
+    An answer outside the county is only used if no provider places the
+    address inside it. With consensus=True every provider is awaited and the
+    spread of their answers is reported.
+    """
+    providers = list(providers or GEOCODE_PROVIDERS)
+    answers = {}
+    failed = {}
+    pending = {}
+    pool = ThreadPoolExecutor(max_workers=len(providers))
+    launched = 0
+    chosen = None
+
+    def launch():
+        nonlocal launched
+        kind, method = providers[launched]
+        pending[pool.submit(method, address)] = kind
+        launched += 1
+
+    try:
+        launch()
+        while pending:
+            delay = None
+            if launched < len(providers):
+                delay = max(geocode_hedge_delay(kind) for kind in pending.values())
+            done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            unhelpful = False
+            for future in done:
+                kind = pending.pop(future)
+                try:
+                    answers[kind] = future.result()
+                except Exception as e:
+                    failed[kind] = e
+                    unhelpful = True
+                    continue
+                if chosen is None and geocode_in_service_area(*answers[kind]):
+                    chosen = kind
+                else:
+                    unhelpful = True
+            if chosen is not None and not consensus:
+                break
+            if launched < len(providers) and (unhelpful or consensus):
+                launch()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if chosen is None and answers:
+        chosen = next(kind for kind, _ in providers if kind in answers)
+    if chosen is None:
+        return {"coords": None, "provider": None,
+                "all_not_found": all(isinstance(e, GeocodeNotFound) for e in failed.values())}
+
+    result = {"coords": answers[chosen], "provider": chosen}
+    if consensus and len(answers) > 1:
+        lat, lng = answers[chosen]
+        others = [answers[k] for k in answers if k != chosen]
+        spread = max(batch_distances_feet(lat, lng, [o[0] for o in others], [o[1] for o in others]))
+        result["disagreement_feet"] = round(float(spread))
+        result["flagged"] = bool(spread > GEOCODE_CONSENSUS_FEET)
+        if result["flagged"]:
+            print(f"[WARN] Geocoders disagree by {round(float(spread))} ft for {address!r}: "
+                  + ", ".join(f"{k}={v[0]:.5f},{v[1]:.5f}" for k, v in answers.items()))
+    return result
 
 
 def extract_osm_address(tags):
@@ -170,15 +1483,21 @@ def extract_osm_address(tags):
     return None
 
 
+@timed_stage("reverse_geocode")
 def reverse_geocode_clean(lat, lon, name):
     #Get the address using the coordinates if unavailable in OSM
     #Reverse geocode with ArcGIS primary and Census fallback.
+    key = coordinate_key(lat, lon)
+    cached = geocode_cache_get("reverse", key)
+    if cached is not None:
+        return cached["address"] if cached["found"] else "Address unavailable"
     try:
         # --- Try ArcGIS first ---
-        arcgis = ArcGIS(timeout=10)
-        location = arcgis.reverse((lat, lon), exactly_one=True)
+        arcgis = get_geocoder("arcgis")
+        location = geopy_call("arcgis", arcgis.reverse, (lat, lon), exactly_one=True)
         if not location:
             print("WARNING: ArcGIS returned no resulting address for a set of coordinates.")
+            geocode_cache_put("reverse", key, False, lat, lon, provider="arcgis")
             return "Address unavailable"
 
         #print("ArcGIS location:")
@@ -202,6 +1521,7 @@ def reverse_geocode_clean(lat, lon, name):
         address = f"{location.address}"
         address = address.strip(", ")
         #print("address after reverse_geocode_clean: " + address)
+        geocode_cache_put("reverse", key, True, lat, lon, address, provider="arcgis")
         return address
 
     except Exception as e:
@@ -214,14 +1534,20 @@ def reverse_geocode_clean(lat, lon, name):
 # GOOGLE PLACES APIS
 # ---------------------------
 
+@timed_stage("places_text")
 def text_search(query, lat, lng, radius_meters):
     #NOTE: this api will only ever give a max of 20 entries
-    url = "https://places.googleapis.com/v1/places:searchText"
+    cached = places_cache_lookup("text", query, None, lat, lng, radius_meters)
+    if cached is not None:
+        return cached
+
+    url = provider_url("google_places", "/v1/places:searchText")
 
     headers = {
         "Content-Type": "application/json",
         "X-Goog-Api-Key": API_KEY,
         "X-Goog-FieldMask": (
+            "places.id,"
             "places.displayName,"
             "places.formattedAddress,"
             "places.types,"
@@ -239,27 +1565,33 @@ def text_search(query, lat, lng, radius_meters):
         }
     }
 
-    response = requests.post(url, headers=headers, json=payload, timeout=10)
-
-    response.raise_for_status()
+    charge_places_request("text")
+    response = http_request("POST", url, provider="google_places", headers=headers, json=payload)
 
     data = response.json()
 
-    return data.get("places", [])
+    places = data.get("places", [])
+    places_cache_store("text", query, None, lat, lng, radius_meters, places)
+    return places
 
 
+@timed_stage("places_nearby")
 def search_nearby_new(lat, lng, included_types, radius_meters):
     #print("inside search nearby. Lat: " + str(lat) + ", lng: " + str(lng) + ", radius_meters: " + str(radius_meters))
     #print("included types: ")
     #print(included_types)
 
     #NOTE: this api will only ever give a max of 20 entries
-    url = f"https://places.googleapis.com/v1/places:searchNearby?key={API_KEY}"
+    cached = places_cache_lookup("nearby", None, included_types, lat, lng, radius_meters)
+    if cached is not None:
+        return cached
+
+    url = provider_url("google_places", f"/v1/places:searchNearby?key={API_KEY}")
 
 
     headers = {
         "Content-Type": "application/json",
-        "X-Goog-FieldMask": "places.displayName,places.formattedAddress,places.types,places.location"
+        "X-Goog-FieldMask": "places.id,places.displayName,places.formattedAddress,places.types,places.location"
     }
 
 
@@ -274,22 +1606,194 @@ def search_nearby_new(lat, lng, included_types, radius_meters):
     }
 
 
-    response = requests.post(url, headers=headers, json=payload, timeout=10)
-
-    response.raise_for_status()
+    charge_places_request("nearby")
+    response = http_request("POST", url, provider="google_places", headers=headers, json=payload)
 
     data = response.json()
 
-    return data.get("places", [])
+    places = data.get("places", [])
+    places_cache_store("nearby", None, included_types, lat, lng, radius_meters, places)
+    return places
+
+
+def place_key(place):
+    """Stable identity for a Places result: its place id, else its name and location."""
+    if place.get("id"):
+        return place["id"]
+    loc = place.get("location", {})
+    return (place.get("displayName", {}).get("text", "").lower(), loc.get("latitude"), loc.get("longitude"))
+
+
+def quadrant_cells(lat, lng, half_side_meters):
+    """Split a square cell (center, half side) into its four quadrant cells."""
+    quarter = half_side_meters / 2
+    dlat = quarter / 111320.0
+    dlng = dlat / np.cos(np.radians(lat))
+    return [(lat + sy * dlat, lng + sx * dlng, quarter) for sy in (-1, 1) for sx in (-1, 1)]
+
+
+def places_inside(places, lat, lng, radius_meters):
+    """Number of Places results located within radius_meters of the point."""
+    located = [p["location"] for p in places
+               if p.get("location", {}).get("latitude") is not None
+               and p.get("location", {}).get("longitude") is not None]
+    if not located:
+        return 0
+    distances = haversine_meters(lat, lng, [loc["latitude"] for loc in located],
+                                 [loc["longitude"] for loc in located])
+    return int(np.count_nonzero(distances <= radius_meters))
+
+
+def nearby_saturated(places, lat, lng, radius_meters):
+    """Nearby Search is restricted to the circle, so a full page means there may be more."""
+    return len(places) >= PLACES_MAX_RESULTS
+
+
+def text_saturated(places, lat, lng, radius_meters):
+    """Text Search is only biased toward the circle and returns a full page of relevance-ranked
+    results from anywhere, so it is saturated only if the whole page lies inside the circle."""
+    return len(places) >= PLACES_MAX_RESULTS and places_inside(places, lat, lng, radius_meters) >= PLACES_MAX_RESULTS
+
+
+def adaptive_places_search(search_fn, lat, lng, radius_meters, min_radius_meters=None,
+                           saturated=None, max_depth=None):
+    """Run search_fn(lat, lng, radius) and recursively subdivide saturated circles.
+
+    The search circle's bounding square is split quadtree-style; each
+    quadrant is searched with its circumscribed circle, so the children
+    always cover the parent. Sparse areas cost a single call and only cells
+    that are saturated(places, lat, lng, radius) are split, at most max_depth
+    levels deep. Results are deduplicated by place id.
+    """
+    min_radius_meters = min_radius_meters or PLACES_MIN_SPLIT_RADIUS_METERS
+    saturated = saturated or nearby_saturated
+    found = {}
+    # (lat, lng, search radius, half side of the square cell being covered, depth)
+    stack = [(lat, lng, radius_meters, radius_meters, 0)]
+    while stack:
+        c_lat, c_lng, c_radius, half_side, depth = stack.pop()
+        places = search_fn(c_lat, c_lng, c_radius)
+        for place in places:
+            found.setdefault(place_key(place), place)
+        if saturated(places, c_lat, c_lng, c_radius):
+            if half_side / 2 * 2 ** 0.5 >= min_radius_meters and (max_depth is None or depth < max_depth):
+                stack.extend((q_lat, q_lng, q_half * 2 ** 0.5, q_half, depth + 1)
+                             for q_lat, q_lng, q_half in quadrant_cells(c_lat, c_lng, half_side))
+            else:
+                print(f"[WARN] Places search still saturated at {c_radius:.0f} m near ({c_lat:.5f}, {c_lng:.5f})")
+    return list(found.values())
+
+
+def adaptive_search_nearby(lat, lng, included_types, radius_meters):
+    """search_nearby_new without the 20-result cap (see adaptive_places_search)."""
+    return adaptive_places_search(
+        lambda c_lat, c_lng, c_radius: search_nearby_new(c_lat, c_lng, included_types, c_radius),
+        lat, lng, radius_meters)
+
+
+def adaptive_text_search(query, lat, lng, radius_meters):
+    """text_search without the 20-result cap (see adaptive_places_search)."""
+    return adaptive_places_search(
+        lambda c_lat, c_lng, c_radius: text_search(query, c_lat, c_lng, c_radius),
+        lat, lng, radius_meters, saturated=text_saturated, max_depth=PLACES_TEXT_MAX_SPLIT_DEPTH)
 
 
 # ---------------------------
 # OVERPASS APIS
 # ---------------------------
 
-def query_overpass_restaurants(lat, lon, radius_feet, max_retries=3, delay=5):
+# The county query's poly: filter uses a slightly grown, simplified outline
+# (results are clipped to the exact polygon locally afterwards)
+OVERPASS_POLY_BUFFER_DEGREES = 0.002
+OVERPASS_POLY_SIMPLIFY_DEGREES = 0.001
+
+
+# Large result sets are parsed and filtered in chunks of this many elements
+OSM_STREAM_CHUNK = 2048
+
+
+def overpass_request(query, timeout=60, max_retries=3, delay=5):
+    """POST an Overpass QL query and return the JSON (retries/backoff come from http_request)."""
+    response = http_request("POST", provider_url("overpass", "/api/interpreter"), provider="overpass", timeout=timeout,
+                            max_retries=max_retries, backoff_base=delay, data={"data": query})
+    return response.json()
+
+
+def iter_json_array(chunks, key):
+    """Yield the items of the array under `key` from a stream of JSON text chunks, one item at a time.
+
+    Only the current item (plus one chunk) is held in memory, so the size of
+    the whole document does not matter.
+    """
+    decoder = json.JSONDecoder()
+    marker = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    chunks = iter(chunks)
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        match = marker.search(buf)
+        if match:
+            buf = buf[match.end():]
+            break
+        buf = buf[-(len(key) + 16):]  # the marker may straddle two chunks
+    else:
+        return
+    pos = 0
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            if pos >= len(buf):
+                raise json.JSONDecodeError("need more data", buf, pos)
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError(f"JSON array {key!r} ended unexpectedly")
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+        pos = end
+
+
+def overpass_stream_elements(query, timeout=60, max_retries=3, delay=5):
+    """POST an Overpass QL query and yield its elements as they arrive instead of parsing the whole response."""
+    response = http_request("POST", provider_url("overpass", "/api/interpreter"), provider="overpass",
+                            timeout=timeout, max_retries=max_retries, backoff_base=delay, data={"data": query},
+                            stream=True)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with response:
+        yield from iter_json_array((decoder.decode(c) for c in response.iter_content(65536)), "elements")
+
+
+def iter_chunks(items, size=None):
+    """Group an iterable into lists of at most `size` items."""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size or OSM_STREAM_CHUNK))
+        if not chunk:
+            return
+        yield chunk
+
+
+@timed_stage("overpass_fetch")
+def iter_overpass_restaurants(lat, lon, radius_feet, max_retries=3, delay=5):
+    """Stream restaurant elements within radius_feet of a point (from the offline dataset when available)."""
     radius_meters = radius_feet * 0.3048
 
+    zone = utm_zone_for(lon)
+    circle = unproject_geometry(project_geometry(Point(lon, lat), zone).buffer(radius_meters * 1.001), zone)
+    if offline_osm_dataset_available(circle):
+        restaurants = (e for e in iter_offline_osm_elements() if e.get("tags", {}).get("amenity") == "restaurant")
+        for chunk in iter_chunks(restaurants):
+            coords = [osm_element_coordinates(e) for e in chunk]
+            distances = batch_distances_feet(lat, lon, [c[0] for c in coords], [c[1] for c in coords])
+            yield from compress(chunk, distances <= radius_feet)
+        return
+
     query = f"""
     [out:json];
     (
@@ -298,19 +1802,11 @@ def query_overpass_restaurants(lat, lon, radius_feet, max_retries=3, delay=5):
     );
     out center tags;
     """
-    url = "https://overpass-api.de/api/interpreter"
+    yield from overpass_stream_elements(query, timeout=30, max_retries=max_retries, delay=delay)
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, params={"data": query}, timeout=30)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException:
-            if attempt < max_retries - 1:
-                time.sleep(delay)
-                continue
-            else:
-                raise
+
+def query_overpass_restaurants(lat, lon, radius_feet, max_retries=3, delay=5):
+    return {"elements": list(iter_overpass_restaurants(lat, lon, radius_feet, max_retries, delay))}
 
 
 def query_overpass_keywords(lat, lon, radius_feet, keywords, tags=("name",), max_retries=3, delay=5):
@@ -333,45 +1829,307 @@ def query_overpass_keywords(lat, lon, radius_feet, keywords, tags=("name",), max
     out center tags;
     """
 
-    url = "https://overpass-api.de/api/interpreter"
+    data = overpass_request(query, timeout=60, max_retries=max_retries, delay=delay)
+    print(f"[DEBUG] Overpass returned {len(data.get('elements', []))} results")
+    return data
+
+
+def overpass_poly_filters(polygon):
+    """Overpass (poly:"lat lon ...") filters covering the polygon, one per part of a multipolygon."""
+    outline = polygon.buffer(OVERPASS_POLY_BUFFER_DEGREES).simplify(OVERPASS_POLY_SIMPLIFY_DEGREES)
+    parts = getattr(outline, "geoms", [outline])
+    filters = []
+    for part in parts:
+        coords = " ".join(f"{lat:.5f} {lng:.5f}" for lng, lat in part.exterior.coords[:-1])
+        filters.append(f'(poly:"{coords}")')
+    return filters
+
+
+def overpass_youth_selectors(area_filter):
+    """Overpass statements for the OSM equivalents of SEARCH_TYPES plus SEARCH_KEYWORDS names."""
+    selectors = []
+    for place_type in SEARCH_TYPES:
+        for key, value in OSM_YOUTH_TAGS.get(place_type, []):
+            selectors.append(f'nwr["{key}"="{value}"]{area_filter};')
+    if SEARCH_KEYWORDS:
+        keyword_pattern = "|".join(re.escape(k) for k in SEARCH_KEYWORDS)
+        selectors.append(f'nwr["name"~"({keyword_pattern})",i]{area_filter};')
+    return selectors
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, params={"data": query}, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-            print(f"[DEBUG] Overpass returned {len(data.get('elements', []))} results")
-            return data
-        except requests.RequestException as e:
-            print(f"[WARN] Overpass attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(delay)
-            else:
-                raise
+
+_county_osm_cache = {}
+_county_osm_lock = threading.Lock()
+
+
+@timed_stage("overpass_fetch")
+def query_overpass_county(polygon, max_retries=3, delay=5):
+    """Fetch restaurants and youth congregation features inside the polygon in a single Overpass query.
+
+    Returns {"restaurants": [OsmFeature], "youth_sites": [site records]}, both
+    clipped to the exact polygon. The response is parsed and filtered as it
+    streams in, so only the kept features are ever held. Results are kept for
+    the rest of the run.
+    """
+    key = polygon.wkb
+    with _county_osm_lock:
+        if key in _county_osm_cache:
+            return _county_osm_cache[key]
+
+        if offline_osm_dataset_available(polygon):
+            elements = iter_offline_osm_elements()
+        else:
+            selectors = []
+            for area_filter in overpass_poly_filters(polygon):
+                selectors.append(f'node["amenity"="restaurant"]{area_filter};')
+                selectors.append(f'way["amenity"="restaurant"]{area_filter};')
+                selectors.extend(overpass_youth_selectors(area_filter))
+            query = "[out:json][timeout:240];\n(\n  " + "\n  ".join(selectors) + "\n);\nout center tags;"
+            elements = overpass_stream_elements(query, timeout=300, max_retries=max_retries, delay=delay)
+
+        restaurants = []
+        youth_sites = []
+        for chunk in iter_chunks(elements):
+            coords = [osm_element_coordinates(element) or (np.nan, np.nan) for element in chunk]
+            inside = points_in_polygon(polygon, [c[0] for c in coords], [c[1] for c in coords])
+            for element in compress(chunk, inside):
+                if element.get("tags", {}).get("amenity") == "restaurant":
+                    feature = OsmFeature.from_element(element)
+                    if feature is not None:
+                        restaurants.append(feature)
+                else:
+                    site = osm_element_to_site(element)
+                    if site:
+                        youth_sites.append(site)
+
+        print(f"[DEBUG] Overpass county query returned {len(restaurants)} restaurants "
+              f"and {len(youth_sites)} youth congregation sites")
+        result = {"restaurants": restaurants, "youth_sites": youth_sites}
+        _county_osm_cache[key] = result
+        return result
 
 
 
+# ---------------------------
+# OFFLINE OSM EXTRACTS
+# ---------------------------
+
+def _open_osm_file(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def osm_tags_wanted(tags):
+    """True for restaurants and for features osm_element_to_site would accept."""
+    if tags.get("amenity") == "restaurant" and tags.get("name"):
+        return True
+    return osm_element_to_site({"type": "node", "id": 0, "lat": 0.0, "lon": 0.0, "tags": tags}) is not None
+
+
+def _iterparse_osm(path, tag):
+    """Stream (element, tags) for every <tag> element of an .osm XML file, clearing parsed elements as it goes."""
+    with _open_osm_file(path) as f:
+        context = ElementTree.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or elem.tag not in ("node", "way", "relation"):
+                continue
+            if elem.tag == tag:
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                yield elem, tags
+            elem.clear()
+            root.clear()
+
+
+def iter_osm_xml_elements(path):
+    """Yield Overpass-style element dicts for wanted nodes and ways in an .osm (or .osm.bz2/.gz) file.
+
+    Two streaming passes keep memory proportional to the wanted features,
+    not the extract: the first collects the node ids of wanted ways, the
+    second reads those nodes' coordinates (and emits wanted nodes). Ways get
+    the center of their bounding box, like Overpass's "out center".
+    Relations are not resolved.
+    """
+    ways = []
+    needed = set()
+    for elem, tags in _iterparse_osm(path, "way"):
+        if osm_tags_wanted(tags):
+            refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+            ways.append((int(elem.get("id")), tags, refs))
+            needed.update(refs)
+
+    node_coords = {}
+    for elem, tags in _iterparse_osm(path, "node"):
+        node_id = int(elem.get("id"))
+        lat, lon = float(elem.get("lat")), float(elem.get("lon"))
+        if node_id in needed:
+            node_coords[node_id] = (lat, lon)
+        if tags and osm_tags_wanted(tags):
+            yield {"type": "node", "id": node_id, "lat": lat, "lon": lon, "tags": tags}
+
+    for way_id, tags, refs in ways:
+        coords = [node_coords[r] for r in refs if r in node_coords]
+        if not coords:
+            continue
+        lats = [c[0] for c in coords]
+        lons = [c[1] for c in coords]
+        center = {"lat": (min(lats) + max(lats)) / 2, "lon": (min(lons) + max(lons)) / 2}
+        yield {"type": "way", "id": way_id, "center": center, "tags": tags}
+
+
+def iter_osm_pbf_elements(path):
+    """Yield Overpass-style element dicts for wanted nodes and ways in an .osm.pbf file (requires pyosmium)."""
+    if osmium is None:
+        raise ImportError("Reading .osm.pbf files requires pyosmium (pip install osmium)")
+    processor = osmium.FileProcessor(path, osmium.osm.NODE | osmium.osm.WAY).with_locations()
+    for obj in processor:
+        tags = {t.k: t.v for t in obj.tags}
+        if not tags or not osm_tags_wanted(tags):
+            continue
+        if obj.is_node():
+            yield {"type": "node", "id": obj.id, "lat": obj.location.lat, "lon": obj.location.lon, "tags": tags}
+        else:
+            locations = [n.location for n in obj.nodes if n.location.valid()]
+            if not locations:
+                continue
+            lats = [loc.lat for loc in locations]
+            lons = [loc.lon for loc in locations]
+            center = {"lat": (min(lats) + max(lats)) / 2, "lon": (min(lons) + max(lons)) / 2}
+            yield {"type": "way", "id": obj.id, "center": center, "tags": tags}
+
+
+def ingest_osm_extract(path, polygon=None, out_path=None):
+    """Extract restaurants and youth congregation features from a local OSM extract into OSM_OFFLINE_DATASET.
+
+    Features are kept out to RADIUS_FEET beyond the polygon (default: Shelby
+    County), so sites across the line are there too, and written one JSON
+    element per line to a gzip file as they are parsed. The metadata line
+    records the area the dataset is complete for and the search types and
+    keywords it was filtered with.
+    """
+    polygon = harvest_area(polygon or shelby_polygon, RADIUS_FEET)
+    shapely.prepare(polygon)
+    out_path = out_path or OSM_OFFLINE_DATASET
+    elements = iter_osm_pbf_elements(path) if path.endswith(".pbf") else iter_osm_xml_elements(path)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    kept = 0
+    with gzip.open(out_path + ".tmp", "wt", encoding="utf-8") as out:
+        out.write(json.dumps({"source": os.path.basename(path), "created": time.time(),
+                              "bounds": list(polygon.bounds), "area": polygon.wkt,
+                              "search": search_settings()}) + "\n")
+        for element in elements:
+            lat, lon = osm_element_coordinates(element)
+            if not shapely.contains_xy(polygon, lon, lat):
+                continue
+            out.write(json.dumps(element, separators=(",", ":")) + "\n")
+            kept += 1
+    os.replace(out_path + ".tmp", out_path)
+    with _county_osm_lock:
+        _county_osm_cache.clear()
+    print(f"Stored {kept} OSM features in {out_path}")
+    return kept
+
+
+_offline_osm_meta = {}
+
+
+def offline_osm_dataset_meta():
+    """The dataset's metadata line, with "area" parsed (just its bounds for datasets ingested without one)."""
+    key = (OSM_OFFLINE_DATASET, os.path.getmtime(OSM_OFFLINE_DATASET))
+    meta = _offline_osm_meta.get(key)
+    if meta is None:
+        with gzip.open(OSM_OFFLINE_DATASET, "rt", encoding="utf-8") as f:
+            meta = json.loads(next(f))
+        meta["area"] = wkt.loads(meta["area"]) if meta.get("area") else box(*meta["bounds"])
+        shapely.prepare(meta["area"])
+        _offline_osm_meta[key] = meta
+    return meta
+
+
+def offline_osm_dataset_available(area=None):
+    """Whether the offline dataset is enabled, present, ingested for the current search types and
+    keywords, and (if area is given) complete for that area."""
+    if not (USE_OSM_OFFLINE_DATASET and os.path.exists(OSM_OFFLINE_DATASET)):
+        return False
+    meta = offline_osm_dataset_meta()
+    if meta.get("search") != search_settings():
+        print("[DEBUG] Offline OSM dataset was ingested for different search types or keywords; querying Overpass")
+        return False
+    if area is not None and not meta["area"].covers(area):
+        print("[DEBUG] Offline OSM dataset does not cover this area; querying Overpass")
+        return False
+    return True
+
+
+def iter_offline_osm_elements():
+    """Stream the elements of the ingested OSM dataset one line at a time."""
+    with gzip.open(OSM_OFFLINE_DATASET, "rt", encoding="utf-8") as f:
+        next(f)  # metadata line
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
 # ---------------------------
 # MISC UTILITY FUNCTIONS
 # ---------------------------
 
 def inside_shelby_county(lat, lng):
-    return shelby_polygon.contains(Point(lng, lat))
+    return bool(shapely.contains_xy(shelby_polygon, lng, lat))
+
+
+@timed_stage("county_filter")
+def points_in_polygon(polygon, lats, lngs):
+    """Vectorized containment test: boolean array of which (lat, lng) pairs fall inside the polygon.
+
+    The polygon is prepared once, so this stays fast for full-resolution
+    boundaries with thousands of vertices. NaN coordinates are never inside.
+    """
+    shapely.prepare(polygon)
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    inside = np.zeros(lats.shape, dtype=bool)
+    valid = ~(np.isnan(lats) | np.isnan(lngs))
+    # cheap bbox rejection before the exact test
+    min_lng, min_lat, max_lng, max_lat = polygon.bounds
+    valid &= (lngs >= min_lng) & (lngs <= max_lng) & (lats >= min_lat) & (lats <= max_lat)
+    if valid.any():
+        inside[valid] = shapely.contains_xy(polygon, lngs[valid], lats[valid])
+    return inside
 
 def get_youth_congregation_areas(address):
     #print(f"[DEBUG] Geocoding address: {address}")
     lat, lng = geocode_address(address)
-    radius_meters = feet_to_meters(RADIUS_FEET)
+    return get_youth_congregation_areas_at(lat, lng)
+
+
+def collect_google_places(lat, lng, radius_meters, nearby_fn=None, text_fn=None, by_place_id=False,
+                          raise_errors=False):
+    """Run the Nearby Search and keyword Text Searches around a point and return the filtered places.
+
+    nearby_fn/text_fn default to the adaptive (cap-splitting) searches.
+    Duplicates are dropped by name, or by place id with by_place_id=True
+    (needed when one search covers several points, where two same-named
+    places may each be near a different point). A failed search is skipped
+    unless raise_errors is set, as screening needs: a missing answer must
+    never read as "nothing nearby".
+    """
+    nearby_fn = nearby_fn or adaptive_search_nearby
+    text_fn = text_fn or adaptive_text_search
     google_places = []
-    overpass_places = []
     seen_names = set()
-    final_list = []
 
 
     # Nearby Search
     try:
-        places = search_nearby_new(lat, lng, SEARCH_TYPES, radius_meters)
+        places = nearby_fn(lat, lng, SEARCH_TYPES, radius_meters)
+    except PlacesBudgetExceeded:
+        raise
     except Exception:
+        if raise_errors:
+            raise
         places = []
 
     #print("places from nearby search: ")
@@ -379,36 +2137,56 @@ def get_youth_congregation_areas(address):
 
     for place in places:
         name = place.get("displayName", {}).get("text")
-        if not name or name in seen_names:
+        if not name or (place_key(place) if by_place_id else name) in seen_names:
             continue
         placeTypes = place.get("types", [])
         if any(item in EXCLUDE_SEARCH_TYPES for item in placeTypes):
             continue
-        seen_names.add(name.lower())
+        seen_names.add(place_key(place) if by_place_id else name.lower())
         google_places.append(place)
 
 
     # Text Search
     for term in SEARCH_KEYWORDS:
         try:
-            places = text_search(term, lat, lng, radius_meters)
+            places = text_fn(term, lat, lng, radius_meters)
+        except PlacesBudgetExceeded:
+            raise
         except Exception:
+            if raise_errors:
+                raise
             continue
         for place in places:
             name = place.get("displayName", {}).get("text", "")
             #print("place found with " + term + " search text: " + name)
             #print("(1)seen_names: ")
             #print(seen_names)
-            if not name or name.lower() in seen_names:
+            key = place_key(place) if by_place_id else name.lower()
+            if not name or key in seen_names:
                 #print("skipping " + name + " because it is already in seen_names")
                 continue
-            seen_names.add(name.lower())
+            seen_names.add(key)
             combined_text = name.lower()
             if SEARCH_KEYWORDS and not any(k.lower() in combined_text for k in SEARCH_KEYWORDS):
                 #print("skipping " + name + "because it does not have one of the SEARCH_KEYWORDS")
                 continue
             google_places.append(place)
 
+    return google_places
+
+
+def get_youth_congregation_areas_at(lat, lng):
+    """Same as get_youth_congregation_areas but for a point whose coordinates are already known."""
+    site_index = get_site_index()
+    grid = get_verdict_grid()
+    if grid is not None and grid.verdict(lat, lng) is False:
+        return []
+    # the index and safe area only cover Shelby County
+    if site_index is not None and inside_shelby_county(lat, lng):
+        return site_index.query(lat, lng, RADIUS_FEET)
+
+    radius_meters = feet_to_meters(RADIUS_FEET)
+    google_places = collect_google_places(lat, lng, radius_meters)
 
     """
     #Overpass text search
@@ -456,19 +2234,97 @@ def get_youth_congregation_areas(address):
             })
     """
 
-    for place in google_places:
+    return places_within_radius(lat, lng, google_places, RADIUS_FEET)
+
+
+def _place_is_youth_site(place, source):
+    """Apply collect_google_places' filtering rules to a single result from the given source."""
+    name = place.get("displayName", {}).get("text", "")
+    if not name:
+        return False
+    if source == "nearby":
+        return not any(t in EXCLUDE_SEARCH_TYPES for t in place.get("types", []))
+    return not SEARCH_KEYWORDS or any(k.lower() in name.lower() for k in SEARCH_KEYWORDS)
+
+
+def _any_place_within(lat, lng, places, source):
+    return bool(places_within_radius(lat, lng, [p for p in places if _place_is_youth_site(p, source)], RADIUS_FEET))
+
+
+@timed_stage("screen_candidate")
+def has_youth_congregation_nearby(lat, lng):
+    """Return (True/False, source) for whether any youth congregation area is within RADIUS_FEET.
+
+    Sources are tried cheapest first and the first confirmed hit wins: the
+    saved safe area, the site index, cached Places responses, the Nearby
+    Search, then each keyword Text Search. A "no" needs every source, so if
+    a search fails and no other source finds a hit, its error is raised.
+    """
+    grid = get_verdict_grid()
+    if grid is not None:
+        verdict = grid.verdict(lat, lng)
+        if verdict is not None:
+            return (verdict, "grid")
+    # the index and safe area only cover Shelby County
+    in_index_area = inside_shelby_county(lat, lng)
+    zones = get_exclusion_zones()
+    if zones is not None and in_index_area:
+        return (not zones.is_safe(lat, lng), "safe_area")
+    site_index = get_site_index()
+    if site_index is not None and in_index_area:
+        return (bool(site_index.query(lat, lng, RADIUS_FEET)), "site_index")
+
+    radius_meters = feet_to_meters(RADIUS_FEET)
+    cached = places_cache_lookup("nearby", None, SEARCH_TYPES, lat, lng, radius_meters)
+    if cached is not None and _any_place_within(lat, lng, cached, "nearby"):
+        return (True, "cache")
+    for term in SEARCH_KEYWORDS:
+        cached = places_cache_lookup("text", term, None, lat, lng, radius_meters)
+        if cached is not None and _any_place_within(lat, lng, cached, "text"):
+            return (True, "cache")
+
+    searches = [("nearby", lambda: search_nearby_new(lat, lng, SEARCH_TYPES, radius_meters),
+                 lambda: adaptive_search_nearby(lat, lng, SEARCH_TYPES, radius_meters), nearby_saturated)]
+    for term in SEARCH_KEYWORDS:
+        searches.append((f"text:{term}", lambda term=term: text_search(term, lat, lng, radius_meters),
+                         lambda term=term: adaptive_text_search(term, lat, lng, radius_meters), text_saturated))
+
+    failure = None
+    for source, search, adaptive, saturated in searches:
+        kind = "nearby" if source == "nearby" else "text"
+        try:
+            places = search()
+            if _any_place_within(lat, lng, places, kind):
+                return (True, source)
+            # a capped response may be hiding a hit; only then pay for the subdivided search
+            if saturated(places, lat, lng, radius_meters) and _any_place_within(lat, lng, adaptive(), kind):
+                return (True, source)
+        except PlacesBudgetExceeded:
+            raise
+        except Exception as e:
+            failure = failure or e
+    if failure is not None:
+        raise failure
+    return (False, "all_sources")
+
+
+def places_within_radius(lat, lng, google_places, radius_feet):
+    """Turn Places results into distance-sorted youth congregation records within radius_feet of a point."""
+    final_list = []
+    located = [p for p in google_places
+               if p.get("location", {}).get("latitude") is not None
+               and p.get("location", {}).get("longitude") is not None]
+    distances = batch_distances_feet(lat, lng,
+                                     [p["location"]["latitude"] for p in located],
+                                     [p["location"]["longitude"] for p in located],
+                                     threshold_feet=radius_feet)
+
+    for place, dist in zip(located, distances):
         name = place.get("displayName", {}).get("text", "N/A")
         addr = place.get("formattedAddress", "N/A")
         types = place.get("types", [])
-        loc = place.get("location", {})
-        place_lat = loc.get("latitude")
-        place_lng = loc.get("longitude")
-        if place_lat is not None and place_lng is not None:
-            dist_m = geodesic((lat, lng), (place_lat, place_lng)).meters
-            dist_ft = round(dist_m / 0.3048)
-        else:
-            dist_ft = None
-        if dist_ft is not None and dist_ft <= RADIUS_FEET:
+        dist_ft = round(float(dist))
+        if dist_ft <= radius_feet:
             final_list.append({
                 "name": name,
                 "address": addr,
@@ -482,9 +2338,984 @@ def get_youth_congregation_areas(address):
 
 
 
+# ---------------------------
+# CLUSTERED SCREENING
+# ---------------------------
+
+def plan_clusters(points, cell_feet=None, max_members=None):
+    """Group (lat, lng) points that share a CLUSTER_CELL_FEET grid cell.
+
+    Returns a list of index lists; cells with more than max_members points are
+    split into several groups.
+    """
+    cell_feet = cell_feet or CLUSTER_CELL_FEET
+    max_members = max_members or CLUSTER_MAX_MEMBERS
+    if not points:
+        return []
+    lats = [p[0] for p in points]
+    lngs = [p[1] for p in points]
+    zone = utm_zone_for(float(np.mean(lngs)))
+    xs, ys = project_utm(lngs, lats, zone)
+    cell = feet_to_meters(cell_feet)
+    cells = {}
+    for idx, (x, y) in enumerate(zip(xs, ys)):
+        cells.setdefault((int(x // cell), int(y // cell)), []).append(idx)
+    groups = []
+    for key in sorted(cells):
+        members = cells[key]
+        groups.extend(members[i:i + max_members] for i in range(0, len(members), max_members))
+    return groups
+
+
+def cluster_circle(points):
+    """Center and radius (meters) of a circle around the points' centroid that contains all of them."""
+    c_lat = float(np.mean([p[0] for p in points]))
+    c_lng = float(np.mean([p[1] for p in points]))
+    spread = haversine_meters(c_lat, c_lng, [p[0] for p in points], [p[1] for p in points])
+    return c_lat, c_lng, float(np.max(spread)) * (1 + HAVERSINE_MAX_RELATIVE_ERROR) + 1
+
+
+def screen_cluster(points):
+    """Youth congregation records for each point, found with one covering search for the whole group.
+
+    The search radius covers every member plus RADIUS_FEET; results are then
+    assigned back to each member by exact distance. If any of the group's
+    searches is saturated (see nearby_saturated/text_saturated) the group is
+    split in two and retried; a single point falls back to the adaptive
+    per-point search.
+    """
+    if len(points) == 1:
+        return [get_youth_congregation_areas_at(*points[0])]
+
+    c_lat, c_lng, spread = cluster_circle(points)
+    radius_meters = spread + feet_to_meters(RADIUS_FEET)
+    saturated = []
+
+    def nearby(lat, lng, types, radius):
+        places = search_nearby_new(lat, lng, types, radius)
+        if nearby_saturated(places, lat, lng, radius):
+            saturated.append("nearby")
+        return places
+
+    def text(query, lat, lng, radius):
+        places = text_search(query, lat, lng, radius)
+        if text_saturated(places, lat, lng, radius):
+            saturated.append(query)
+        return places
+
+    google_places = collect_google_places(c_lat, c_lng, radius_meters, nearby_fn=nearby, text_fn=text,
+                                          by_place_id=True, raise_errors=True)
+    if saturated:
+        # split along the longer axis of the group and screen each half on its own
+        lat_range = max(p[0] for p in points) - min(p[0] for p in points)
+        lng_range = (max(p[1] for p in points) - min(p[1] for p in points)) * np.cos(np.radians(c_lat))
+        axis = 0 if lat_range >= lng_range else 1
+        order = sorted(range(len(points)), key=lambda i: points[i][axis])
+        half = len(order) // 2
+        results = [None] * len(points)
+        for part in (order[:half], order[half:]):
+            for idx, found in zip(part, screen_cluster([points[i] for i in part])):
+                results[idx] = found
+        return results
+
+    return [places_within_radius(lat, lng, google_places, RADIUS_FEET) for lat, lng in points]
+
+
+# ---------------------------
+# SCAN JOURNAL (CHECKPOINT / RESUME)
+# ---------------------------
+
+def candidate_key(record):
+    """Stable identity of a scan candidate: its OSM id, else its coordinates."""
+    return record.get("osm_id") or f"{float(record['lat']):.6f},{float(record['lng']):.6f}"
+
+
+class ScanJournal:
+    """Write-ahead JSONL journal of per-candidate screening results plus a snapshot of the candidate list.
+
+    Appends are buffered and fsync'd every JOURNAL_FSYNC_EVERY records or
+    JOURNAL_FSYNC_SECONDS seconds (and on close), so durability doesn't
+    throttle the scan. A torn final line from a crash is ignored on load.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or SCAN_JOURNAL_DIR
+        self.snapshot_path = os.path.join(self.directory, "candidates.json")
+        self.journal_path = os.path.join(self.directory, "journal.jsonl")
+        self.done = {}
+        self.lock = threading.Lock()
+        self.file = None
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def has_snapshot(self):
+        return os.path.exists(self.snapshot_path)
+
+    def start(self, candidates, meta=None):
+        """Begin a new scan: snapshot the candidates and truncate the journal."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "meta": meta or {}, "candidates": candidates}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.done = {}
+        self.file = open(self.journal_path, "w", encoding="utf-8")
+
+    def resume(self):
+        """Reopen an existing scan; returns (candidates, meta) and loads completed results into self.done."""
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        self.done = {}
+        good_end = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn write at the end of the journal
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self.done[entry["key"]] = entry
+                    good_end += len(line)
+            # cut off any torn tail so new records don't get glued onto it
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_end)
+        self.file = open(self.journal_path, "a", encoding="utf-8")
+        return snapshot["candidates"], snapshot.get("meta", {})
+
+    def record(self, key, **result):
+        entry = dict(result, key=key)
+        with self.lock:
+            self.done[key] = entry
+            self.file.write(json.dumps(entry) + "\n")
+            self.pending += 1
+            if self.pending >= JOURNAL_FSYNC_EVERY or time.monotonic() - self.last_sync >= JOURNAL_FSYNC_SECONDS:
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
+
+    def is_complete(self):
+        """True if every snapshotted candidate has a journaled result."""
+        if not self.has_snapshot():
+            return True
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            candidates = json.load(f)["candidates"]
+        done = set(self.done)
+        if self.file is None and os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        done.add(json.loads(line)["key"])
+                    except ValueError:
+                        break
+        return all(candidate_key(c) in done for c in candidates)
+
+
+def iter_screen_restaurants(restaurants, workers=None, journal=None, resolve_addresses_for=None):
+    """Screen restaurants concurrently, yielding (index, safe) as each verdict arrives.
+
+    Each restaurant gets "screened_by", and with resolve_addresses_for set to
+    "safe" or "all" the missing "address" of those restaurants is resolved in
+    the worker too. With a journal, already-journaled restaurants are
+    yielded from it first and every new verdict is journaled. Restaurants that
+    could not be checked count as not safe; if the Places budget runs out the
+    scan stops cleanly and the remaining restaurants are never yielded.
+    """
+    workers = workers or SCREENING_WORKERS
+    total = len(restaurants)
+    todo = list(range(total))
+    if journal is not None:
+        todo = []
+        for idx, rest in enumerate(restaurants):
+            entry = journal.done.get(candidate_key(rest))
+            if entry is None:
+                todo.append(idx)
+                continue
+            rest["screened_by"] = entry.get("screened_by")
+            if entry.get("address") and not rest.get("address"):
+                rest["address"] = entry["address"]
+            yield idx, entry["safe"]
+        if total - len(todo):
+            print(f"[DEBUG] Resuming: {total - len(todo)} of {total} restaurants already checked")
+
+    zones = get_exclusion_zones()
+    clustered = CLUSTER_SCREENING and zones is None and get_site_index() is None
+
+    def screen(group):
+        if clustered and len(group) > 1:
+            found = screen_cluster([(restaurants[i]["lat"], restaurants[i]["lng"]) for i in group])
+            results = [(not places, "cluster") for places in found]
+        else:
+            results = []
+            for i in group:
+                nearby, source = has_youth_congregation_nearby(restaurants[i]["lat"], restaurants[i]["lng"])
+                results.append((not nearby, source))
+        if resolve_addresses_for:
+            for i, (safe, _) in zip(group, results):
+                rest = restaurants[i]
+                if (safe or resolve_addresses_for == "all") and not rest.get("address"):
+                    rest["address"] = reverse_geocode_clean(rest["lat"], rest["lng"], rest["name"])
+        return results
+
+    if clustered:
+        groups = [[todo[i] for i in group]
+                  for group in plan_clusters([(restaurants[idx]["lat"], restaurants[idx]["lng"]) for idx in todo])]
+        print(f"[DEBUG] Screening {len(todo)} restaurants as {len(groups)} clusters")
+    else:
+        groups = [[idx] for idx in todo]
+
+    done = total - len(todo)
+    next_report = 10
+    decided_by = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(screen, group): group for group in groups}
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                verdicts = future.result()
+            except PlacesBudgetExceeded as e:
+                print(f"[ERROR] {e}; stopping after {done} of {total} restaurants.")
+                pool.shutdown(wait=True, cancel_futures=True)
+                break
+            except Exception as e:
+                names = ", ".join(restaurants[i]["name"] for i in group)
+                print(f"[WARN] Could not check {names}: {e}")
+                verdicts = [(False, "error")] * len(group)
+            done += len(group)
+            if done >= next_report or done == total:
+                print(f"[PROGRESS] Checked {done} of {total} restaurants…")
+                next_report = (done // 10 + 1) * 10
+            for idx, (safe, source) in zip(group, verdicts):
+                rest = restaurants[idx]
+                rest["screened_by"] = source
+                decided_by[source] = decided_by.get(source, 0) + 1
+                if journal is not None and source != "error":
+                    journal.record(candidate_key(rest), safe=safe, screened_by=source, address=rest.get("address"))
+                yield idx, safe
+
+    if decided_by:
+        print("[DEBUG] Screening decided by: " + ", ".join(f"{k}={v}" for k, v in sorted(decided_by.items())))
+
+
+def screen_restaurants(restaurants, workers=None, journal=None):
+    """Screen restaurants concurrently and return those with no youth congregation areas nearby.
+
+    Results keep the input order regardless of which worker finishes first.
+    With a journal, already-journaled restaurants are skipped and every new
+    verdict is journaled as it arrives.
+    """
+    verdicts = [None] * len(restaurants)
+    for idx, safe in iter_screen_restaurants(restaurants, workers, journal):
+        verdicts[idx] = safe
+    return [rest for rest, safe in zip(restaurants, verdicts) if safe]
+
+
+def in_input_order(verdicts):
+    """Reorder (index, value) pairs arriving in any order into index order, yielding as soon as possible.
+
+    Pairs left behind a gap (e.g. after the screening stopped early) are
+    yielded in index order at the end.
+    """
+    ready = {}
+    next_idx = 0
+    for idx, value in verdicts:
+        ready[idx] = value
+        while next_idx in ready:
+            yield next_idx, ready.pop(next_idx)
+            next_idx += 1
+    for idx in sorted(ready):
+        yield idx, ready[idx]
+
+
+# ---------------------------
+# PROHIBITED SITE INDEX
+# ---------------------------
+
+def utm_zone_for(lng):
+    return int((lng + 180) // 6) + 1
+
+
+def project_utm(lngs, lats, zone):
+    """Project WGS84 lon/lat arrays to UTM (northern hemisphere) easting/northing in meters.
+
+    Uses the Krüger series, accurate to well under a millimeter within the zone.
+    """
+    a = 6378137.0
+    f = 1 / 298.257223563
+    n = f / (2 - f)
+    big_a = a / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    alpha = (n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16,
+             13 * n ** 2 / 48 - 3 * n ** 3 / 5,
+             61 * n ** 3 / 240)
+    k0 = 0.9996
+
+    lat = np.radians(np.asarray(lats, dtype=float))
+    dlng = np.radians(np.asarray(lngs, dtype=float) - (zone * 6 - 183))
+    c = 2 * np.sqrt(n) / (1 + n)
+    sin_lat = np.sin(lat)
+    t = np.sinh(np.arctanh(sin_lat) - c * np.arctanh(c * sin_lat))
+    xi = np.arctan2(t, np.cos(dlng))
+    eta = np.arctanh(np.sin(dlng) / np.sqrt(1 + t ** 2))
+
+    easting = eta.copy()
+    northing = xi.copy()
+    for j, alpha_j in enumerate(alpha, 1):
+        easting += alpha_j * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        northing += alpha_j * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+    return 500000 + k0 * big_a * easting, k0 * big_a * northing
+
+
+def unproject_utm(eastings, northings, zone):
+    """Inverse of project_utm: UTM easting/northing arrays back to WGS84 (lons, lats)."""
+    a = 6378137.0
+    f = 1 / 298.257223563
+    n = f / (2 - f)
+    big_a = a / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    beta = (n / 2 - 2 * n ** 2 / 3 + 37 * n ** 3 / 96,
+            n ** 2 / 48 + n ** 3 / 15,
+            17 * n ** 3 / 480)
+    delta = (2 * n - 2 * n ** 2 / 3 - 2 * n ** 3,
+             7 * n ** 2 / 3 - 8 * n ** 3 / 5,
+             56 * n ** 3 / 15)
+    k0 = 0.9996
+
+    xi = np.asarray(northings, dtype=float) / (k0 * big_a)
+    eta = (np.asarray(eastings, dtype=float) - 500000) / (k0 * big_a)
+    xi_p = xi.copy()
+    eta_p = eta.copy()
+    for j, beta_j in enumerate(beta, 1):
+        xi_p -= beta_j * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+        eta_p -= beta_j * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+    chi = np.arcsin(np.sin(xi_p) / np.cosh(eta_p))
+    lat = chi.copy()
+    for j, delta_j in enumerate(delta, 1):
+        lat += delta_j * np.sin(2 * j * chi)
+    lng = (zone * 6 - 183) + np.degrees(np.arctan2(np.sinh(eta_p), np.cos(xi_p)))
+    return lng, np.degrees(lat)
+
+
+def utm_scale_factor(eastings):
+    """Point scale factor of UTM at the given eastings (distances on the grid = k * true distance)."""
+    offset = np.asarray(eastings, dtype=float) - 500000
+    return 0.9996 * (1 + offset ** 2 / (2 * (0.9996 * 6381000.0) ** 2))
+
+
+def project_geometry(geom, zone):
+    """Project a lon/lat shapely geometry into UTM meters."""
+    return shapely.transform(geom, lambda c: np.column_stack(project_utm(c[:, 0], c[:, 1], zone)))
+
+
+def unproject_geometry(geom, zone):
+    """Project a UTM shapely geometry back to lon/lat."""
+    return shapely.transform(geom, lambda c: np.column_stack(unproject_utm(c[:, 0], c[:, 1], zone)))
+
+
+def osm_element_coordinates(element):
+    """Return (lat, lon) of an Overpass node, or the center of a way/relation."""
+    if "lat" in element:
+        return element["lat"], element["lon"]
+    center = element.get("center")
+    if not center:
+        return None
+    return center["lat"], center["lon"]
+
+
+def osm_site_types(tags):
+    """Map an OSM element's tags to the Google-style place types used in SEARCH_TYPES."""
+    return [place_type for place_type, pairs in OSM_YOUTH_TAGS.items()
+            if any(tags.get(k) == v for k, v in pairs)]
+
+
+def osm_element_to_site(element):
+    """Convert an Overpass element into a prohibited-site record, or None if it doesn't qualify."""
+    tags = element.get("tags", {})
+    coords = osm_element_coordinates(element)
+    if not coords:
+        return None
+    types = osm_site_types(tags)
+    if any(t in EXCLUDE_SEARCH_TYPES for t in types):
+        return None
+    name = tags.get("name")
+    matched_type = any(t in SEARCH_TYPES for t in types)
+    matched_keyword = bool(name) and any(k.lower() in name.lower() for k in SEARCH_KEYWORDS)
+    if not matched_type and not matched_keyword:
+        return None
+    if not name:
+        name = f"Unnamed {types[0].replace('_', ' ')}" if types else "Unnamed site"
+    lat, lon = coords
+    return {
+        "id": f"osm:{element.get('type', 'node')}/{element.get('id')}",
+        "name": name,
+        "address": extract_osm_address(tags) or "Address unavailable",
+        "types": types,
+        "lat": lat,
+        "lng": lon,
+        "source": "overpass",
+    }
+
+
+def google_place_to_site(place):
+    loc = place.get("location", {})
+    if loc.get("latitude") is None or loc.get("longitude") is None:
+        return None
+    name = place.get("displayName", {}).get("text", "N/A")
+    return {
+        "id": f"places:{place.get('id') or name.lower()}",
+        "name": name,
+        "address": place.get("formattedAddress", "N/A"),
+        "types": place.get("types", []),
+        "lat": loc["latitude"],
+        "lng": loc["longitude"],
+        "source": "places",
+    }
+
+
+def harvest_tile_centers(polygon, radius_meters):
+    """Centers of circles of the given radius that together cover the polygon."""
+    min_lng, min_lat, max_lng, max_lat = polygon.bounds
+    # square grid with spacing r*sqrt(2) is fully covered by circles of radius r
+    step_lat = radius_meters * 2 ** 0.5 / 111320.0
+    step_lng = step_lat / np.cos(np.radians((min_lat + max_lat) / 2))
+    centers = []
+    lat = min_lat + step_lat / 2
+    while lat - step_lat / 2 < max_lat:
+        lng = min_lng + step_lng / 2
+        while lng - step_lng / 2 < max_lng:
+            cell = Polygon([(lng - step_lng / 2, lat - step_lat / 2), (lng + step_lng / 2, lat - step_lat / 2),
+                            (lng + step_lng / 2, lat + step_lat / 2), (lng - step_lng / 2, lat + step_lat / 2)])
+            if polygon.intersects(cell):
+                centers.append((float(lat), float(lng)))
+            lng += step_lng
+        lat += step_lat
+    return centers
+
+
+def harvest_area(polygon, radius_feet):
+    """The polygon grown by radius_feet (in UTM, plus rounding and scale slack).
+
+    Sites just across the county line can still be within radius_feet of a
+    point inside it, so the index has to cover this larger area.
+    """
+    zone = utm_zone_for(polygon.representative_point().x)
+    projected = project_geometry(polygon, zone)
+    # grid distance = k * true distance, and a multi-county area can reach well outside its zone
+    minx, _, maxx, _ = projected.bounds
+    scale = max(1.0, float(utm_scale_factor([minx, maxx]).max()))
+    grown = projected.buffer(feet_to_meters(radius_feet + 0.5) * scale * 1.001)
+    return unproject_geometry(grown, zone)
+
+
+def harvest_prohibited_sites(polygon, sources=None):
+    """Collect every prohibited site in the polygon from the configured sources, deduplicated by id."""
+    sources = sources or SITE_INDEX_SOURCES
+    sites = {}
+    shapely.prepare(polygon)
+
+    if "overpass" in sources:
+        print("Harvesting youth congregation sites from OpenStreetMap ...")
+        for site in query_overpass_county(polygon)["youth_sites"]:
+            sites[site["id"]] = site
+
+    if "places" in sources:
+        centers = harvest_tile_centers(polygon, SITE_HARVEST_TILE_RADIUS_METERS)
+        print(f"Harvesting Google Places over {len(centers)} tiles "
+              f"(~{len(centers) * (1 + len(SEARCH_KEYWORDS))} requests) ...")
+
+        def harvest_tile(center):
+            return collect_google_places(center[0], center[1], SITE_HARVEST_TILE_RADIUS_METERS)
+
+        with ThreadPoolExecutor(max_workers=SCREENING_WORKERS) as pool:
+            for done, places in enumerate(pool.map(harvest_tile, centers), 1):
+                for place in places:
+                    site = google_place_to_site(place)
+                    if site and shapely.contains_xy(polygon, site["lng"], site["lat"]):
+                        sites[site["id"]] = site
+                if done % 25 == 0 or done == len(centers):
+                    print(f"[PROGRESS] Harvested {done} of {len(centers)} tiles…")
+
+    print(f"[DEBUG] Total prohibited sites harvested: {len(sites)}")
+    return list(sites.values())
+
+
+class SiteIndex:
+    """Prohibited sites held in an STRtree of UTM-projected points for local radius queries."""
+
+    def __init__(self, sites, created=None, zone=None, radius_feet=None, search=None):
+        self.sites = sites
+        self.created = created if created is not None else time.time()
+        # sites are complete out to this distance beyond the county line
+        self.radius_feet = radius_feet
+        # the place types and keywords the sites were harvested for
+        self.search = search
+        if zone is None:
+            # the zone the sites mostly fall in, so e.g. a diff of East Tennessee sites is not projected in Shelby's
+            lng = float(np.median([s["lng"] for s in sites])) if sites else calculate_polygon_center(shelby_polygon)[1]
+            zone = utm_zone_for(lng)
+        self.zone = zone
+        if sites:
+            xs, ys = project_utm([s["lng"] for s in sites], [s["lat"] for s in sites], zone)
+        else:
+            xs, ys = np.empty(0), np.empty(0)
+        self.xs, self.ys = xs, ys
+        self.tree = STRtree([Point(x, y) for x, y in zip(xs, ys)])
+
+    def age_days(self):
+        return (time.time() - self.created) / 86400
+
+    def candidates(self, lat, lng, radius_feet):
+        """Indices of sites within radius_feet in projected space (with slack for the UTM scale error)."""
+        x, y = project_utm([lng], [lat], self.zone)
+        # grid distance = k * true distance; k stays below 1.001 inside the zone but grows outside it
+        slack = max(1.0, float(utm_scale_factor(x[0]))) * 1.001
+        return self.tree.query(Point(x[0], y[0]), predicate="dwithin",
+                               distance=feet_to_meters(radius_feet) * slack)
+
+    def query(self, lat, lng, radius_feet):
+        """Return sites within radius_feet of the point, in the same form as get_youth_congregation_areas."""
+        final_list = []
+        candidates = [self.sites[int(idx)] for idx in self.candidates(lat, lng, radius_feet)]
+        distances = batch_distances_feet(lat, lng, [s["lat"] for s in candidates], [s["lng"] for s in candidates],
+                                         threshold_feet=radius_feet)
+        for site, dist in zip(candidates, distances):
+            dist_ft = round(float(dist))
+            if dist_ft <= radius_feet:
+                final_list.append({
+                    "name": site["name"],
+                    "address": site["address"],
+                    "types": site["types"],
+                    "distance": dist_ft
+                })
+        final_list.sort(key=lambda x: x["distance"])
+        return final_list
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": self.created, "zone": self.zone, "radius_feet": self.radius_feet,
+                       "search": self.search, "sites": self.sites}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["sites"], created=data["created"], zone=data.get("zone"),
+                   radius_feet=data.get("radius_feet"), search=data.get("search"))
+
+
+def search_settings():
+    """The place types and keywords that decide what counts as a prohibited site."""
+    return {"search_types": sorted(SEARCH_TYPES), "search_keywords": sorted(SEARCH_KEYWORDS)}
+
+
+def site_index_path():
+    return os.path.join(CACHE_DIR, "prohibited_sites.json")
+
+
+_site_index = None
+_site_index_checked = False
+_site_index_lock = threading.Lock()
+
+
+def get_site_index():
+    """Return the persisted site index if one exists and is fresh enough, else None."""
+    global _site_index, _site_index_checked
+    with _site_index_lock:
+        if not _site_index_checked:
+            _site_index_checked = True
+            path = site_index_path()
+            if os.path.exists(path):
+                try:
+                    index = SiteIndex.load(path)
+                    if index.age_days() > SITE_INDEX_MAX_AGE_DAYS:
+                        print(f"[WARN] Prohibited site index is {index.age_days():.0f} days old; "
+                              "ignoring it (rebuild with option 3).")
+                    elif (index.radius_feet or 0) < RADIUS_FEET:
+                        print(f"[WARN] Prohibited site index does not cover {RADIUS_FEET} ft beyond the county "
+                              "line; ignoring it (rebuild with option 3).")
+                    elif index.search != search_settings():
+                        print("[WARN] Prohibited site index was built for different search types or keywords; "
+                              "ignoring it (rebuild with option 3).")
+                    else:
+                        _site_index = index
+                except Exception as e:
+                    print(f"[WARN] Could not load prohibited site index: {e}")
+        return _site_index
+
+
+def build_site_index(polygon=None, sources=None):
+    """Harvest prohibited sites in and within RADIUS_FEET of the county, persist them and make the index active."""
+    global _site_index, _site_index_checked
+    polygon = polygon or shelby_polygon
+    index = SiteIndex(harvest_prohibited_sites(harvest_area(polygon, RADIUS_FEET), sources), radius_feet=RADIUS_FEET,
+                      search=search_settings())
+    index.save(site_index_path())
+    with _site_index_lock:
+        _site_index = index
+        _site_index_checked = True
+    return index
+
+
+# ---------------------------
+# EXCLUSION ZONES / SAFE AREA
+# ---------------------------
+
+# segments per quarter circle when buffering sites; the buffer polygon is
+# enlarged slightly so it fully contains the true circle (never under-excludes)
+EXCLUSION_BUFFER_QUAD_SEGS = 16
+# the county polygon is densified to this vertex spacing before it is projected
+EXCLUSION_SEGMENTIZE_DEGREES = 0.001
+
+# Verdict grid: square UTM cells of RADIUS_FEET / VERDICT_GRID_CELLS_PER_RADIUS,
+# each classified once so most point checks are a single array read
+VERDICT_GRID_CELLS_PER_RADIUS = 2
+GRID_OUTSIDE, GRID_SAFE, GRID_PROHIBITED, GRID_BOUNDARY = 0, 1, 2, 3
+
+
+class ExclusionZones:
+    """County area minus RADIUS_FEET around every known prohibited site, held as prepared UTM geometry."""
+
+    def __init__(self, safe_area, excluded, zone, radius_feet, index_created):
+        self.safe_area = safe_area
+        self.excluded = excluded
+        self.zone = zone
+        self.radius_feet = radius_feet
+        self.index_created = index_created
+        self.prepared_safe_area = prep(safe_area)
+        self.prepared_excluded = prep(excluded) if excluded is not None else None
+
+    @classmethod
+    def build(cls, site_index, polygon, radius_feet):
+        zone = site_index.zone
+        start = time.perf_counter()
+        # grid distance = k * true distance, so scale each site's radius by its local scale factor;
+        # the extra half foot matches the per-address check, where round(distance) <= radius_feet is prohibited
+        radii = feet_to_meters(radius_feet + 0.5) * utm_scale_factor(site_index.xs)
+        radii = radii / np.cos(np.pi / (4 * EXCLUSION_BUFFER_QUAD_SEGS))
+        buffers = shapely.buffer(shapely.points(site_index.xs, site_index.ys), radii,
+                                 quad_segs=EXCLUSION_BUFFER_QUAD_SEGS)
+        excluded = shapely.union_all(buffers)
+        union_seconds = time.perf_counter() - start
+        # densify first: a long straight edge in lon/lat is a curve in UTM, not the chord between its ends
+        safe_area = project_geometry(shapely.segmentize(polygon, EXCLUSION_SEGMENTIZE_DEGREES), zone).difference(excluded)
+        total_seconds = time.perf_counter() - start
+        print(f"[DEBUG] Unioned {len(buffers)} exclusion buffers in {union_seconds:.2f}s; "
+              f"safe area built in {total_seconds:.2f}s")
+        return cls(safe_area, excluded, zone, radius_feet, site_index.created)
+
+    def is_safe(self, lat, lng):
+        """True if the point lies outside every exclusion buffer (callers check the county themselves).
+
+        Tested against the excluded area rather than the safe area, so points
+        near the county line are not lost to the projected boundary.
+        """
+        x, y = project_utm([lng], [lat], self.zone)
+        if self.prepared_excluded is None:
+            # saved before the excluded area was kept alongside the safe area
+            return self.prepared_safe_area.contains(Point(x[0], y[0]))
+        return not self.prepared_excluded.intersects(Point(x[0], y[0]))
+
+    def export_geojson(self, path):
+        """Write the safe area and the excluded area (lon/lat) as a GeoJSON FeatureCollection."""
+        features = [
+            {"type": "Feature", "properties": {"kind": "safe_area", "radius_feet": self.radius_feet},
+             "geometry": mapping(unproject_geometry(self.safe_area, self.zone))},
+            {"type": "Feature", "properties": {"kind": "excluded", "radius_feet": self.radius_feet},
+             "geometry": mapping(unproject_geometry(self.excluded, self.zone))},
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+
+    def export_wkb(self, path):
+        """Write the safe area (lon/lat) as WKB."""
+        with open(path, "wb") as f:
+            f.write(wkb.dumps(unproject_geometry(self.safe_area, self.zone)))
+
+    def save(self, path):
+        with open(path + ".excluded.tmp", "wb") as f:
+            f.write(wkb.dumps(self.excluded))
+        os.replace(path + ".excluded.tmp", path + ".excluded")
+        with open(path + ".tmp", "wb") as f:
+            f.write(wkb.dumps(self.safe_area))
+        os.replace(path + ".tmp", path)
+        meta = {"zone": self.zone, "radius_feet": self.radius_feet, "index_created": self.index_created}
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(path, "rb") as f:
+            safe_area = wkb.loads(f.read())
+        excluded = None
+        if os.path.exists(path + ".excluded"):
+            with open(path + ".excluded", "rb") as f:
+                excluded = wkb.loads(f.read())
+        return cls(safe_area, excluded, meta["zone"], meta["radius_feet"], meta["index_created"])
+
+
+def exclusion_zones_path():
+    return os.path.join(CACHE_DIR, "safe_area_utm.wkb")
+
+
+_exclusion_zones = None
+_exclusion_zones_checked = False
+
+
+def get_exclusion_zones():
+    """Return the saved safe area if it matches the active site index and RADIUS_FEET, else None."""
+    global _exclusion_zones, _exclusion_zones_checked
+    site_index = get_site_index()
+    if site_index is None:
+        return None
+    with _site_index_lock:
+        if not _exclusion_zones_checked:
+            _exclusion_zones_checked = True
+            path = exclusion_zones_path()
+            if os.path.exists(path) and os.path.exists(path + ".json"):
+                try:
+                    zones = ExclusionZones.load(path)
+                    if zones.index_created == site_index.created and zones.radius_feet == RADIUS_FEET:
+                        _exclusion_zones = zones
+                except Exception as e:
+                    print(f"[WARN] Could not load safe area: {e}")
+        return _exclusion_zones
+
+
+def build_exclusion_zones(polygon=None):
+    """Build the safe area from the active site index, persist it and make it active."""
+    global _exclusion_zones, _exclusion_zones_checked
+    site_index = get_site_index()
+    if site_index is None:
+        raise ValueError("No prohibited site index available; build it first with option 3.")
+    zones = ExclusionZones.build(site_index, polygon or shelby_polygon, RADIUS_FEET)
+    zones.save(exclusion_zones_path())
+    with _site_index_lock:
+        _exclusion_zones = zones
+        _exclusion_zones_checked = True
+    return zones
+
+
+class VerdictGrid:
+    """County-wide grid of precomputed verdicts, backed by a memory-mapped uint8 array.
+
+    A cell is GRID_SAFE when no prohibited site can be within RADIUS_FEET of
+    any point in it, GRID_PROHIBITED when one site is within RADIUS_FEET of
+    every point in it, GRID_BOUNDARY when it needs an exact check, and
+    GRID_OUTSIDE when it is not wholly inside the county.
+    """
+
+    def __init__(self, cells, x0, y0, cell_meters, zone, radius_feet, index_created):
+        self.cells = cells
+        self.x0, self.y0 = x0, y0
+        self.cell_meters = cell_meters
+        self.zone = zone
+        self.radius_feet = radius_feet
+        self.index_created = index_created
+
+    @classmethod
+    def build(cls, site_index, polygon, radius_feet, cells_per_radius=None):
+        start = time.perf_counter()
+        zone = site_index.zone
+        radius = feet_to_meters(radius_feet)
+        cell = radius / (cells_per_radius or VERDICT_GRID_CELLS_PER_RADIUS)
+        area = project_geometry(polygon, zone)
+        minx, miny, maxx, maxy = area.bounds
+        cols = int(np.ceil((maxx - minx) / cell))
+        rows = int(np.ceil((maxy - miny) / cell))
+        col_idx, row_idx = np.meshgrid(np.arange(cols), np.arange(rows))
+        x_lo = minx + col_idx.ravel() * cell
+        y_lo = miny + row_idx.ravel() * cell
+        boxes = shapely.box(x_lo, y_lo, x_lo + cell, y_lo + cell)
+        centers = shapely.points(x_lo + cell / 2, y_lo + cell / 2)
+        half_diagonal = cell * np.sqrt(2) / 2
+        slack = 1.001  # UTM scale error stays below 0.1% inside a zone, as in SiteIndex.candidates
+
+        shapely.prepare(area)
+        classes = np.full(len(boxes), GRID_OUTSIDE, dtype=np.uint8)
+        inside = shapely.contains(area, boxes)
+        classes[inside] = GRID_SAFE
+        if len(site_index.sites):
+            inside_idx = np.flatnonzero(inside)
+            # any site that could reach some point of the cell makes it at least a boundary cell
+            near = site_index.tree.query(centers[inside_idx], predicate="dwithin",
+                                         distance=radius * slack + half_diagonal)
+            touched = inside_idx[np.unique(near[0])]
+            classes[touched] = GRID_BOUNDARY
+            # a site that reaches every corner of the cell covers all of it
+            (order, _), distances = site_index.tree.query_nearest(centers[touched], return_distance=True,
+                                                                  all_matches=False)
+            nearest = np.full(len(touched), np.inf)
+            nearest[order] = distances
+            classes[touched[nearest + half_diagonal <= radius / slack]] = GRID_PROHIBITED
+
+        grid = cls(classes.reshape(rows, cols), minx, miny, cell, zone, radius_feet, site_index.created)
+        counts = np.bincount(classes, minlength=4)
+        print(f"[DEBUG] Classified {rows}x{cols} grid of {cell:.0f} m cells in {time.perf_counter() - start:.2f}s: "
+              f"{counts[GRID_SAFE]} safe, {counts[GRID_PROHIBITED]} prohibited, "
+              f"{counts[GRID_BOUNDARY]} boundary, {counts[GRID_OUTSIDE]} outside")
+        return grid
+
+    def classify(self, lats, lngs):
+        """Cell class for each point (GRID_OUTSIDE beyond the grid)."""
+        xs, ys = project_utm(np.atleast_1d(lngs), np.atleast_1d(lats), self.zone)
+        cols = np.floor((xs - self.x0) / self.cell_meters).astype(np.int64)
+        rows = np.floor((ys - self.y0) / self.cell_meters).astype(np.int64)
+        valid = (rows >= 0) & (rows < self.cells.shape[0]) & (cols >= 0) & (cols < self.cells.shape[1])
+        result = np.full(xs.shape, GRID_OUTSIDE, dtype=np.uint8)
+        result[valid] = self.cells[rows[valid], cols[valid]]
+        return result
+
+    def verdict(self, lat, lng):
+        """True (prohibited site nearby), False (safe) or None when the cell needs an exact check."""
+        cls = int(self.classify([lat], [lng])[0])
+        if cls == GRID_SAFE:
+            return False
+        if cls == GRID_PROHIBITED:
+            return True
+        return None
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.cells, dtype=np.uint8))
+        os.replace(path + ".tmp", path)
+        meta = {"x0": self.x0, "y0": self.y0, "cell_meters": self.cell_meters, "zone": self.zone,
+                "radius_feet": self.radius_feet, "index_created": self.index_created}
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        cells = np.load(path, mmap_mode="r")
+        return cls(cells, meta["x0"], meta["y0"], meta["cell_meters"], meta["zone"],
+                   meta["radius_feet"], meta["index_created"])
+
+
+def verdict_grid_path():
+    return os.path.join(CACHE_DIR, "verdict_grid.npy")
+
+
+_verdict_grid = None
+_verdict_grid_checked = False
+
+
+def get_verdict_grid():
+    """Return the saved verdict grid if it matches the active site index and RADIUS_FEET, else None."""
+    global _verdict_grid, _verdict_grid_checked
+    site_index = get_site_index()
+    if site_index is None:
+        return None
+    with _site_index_lock:
+        if not _verdict_grid_checked:
+            _verdict_grid_checked = True
+            path = verdict_grid_path()
+            if os.path.exists(path) and os.path.exists(path + ".json"):
+                try:
+                    grid = VerdictGrid.load(path)
+                    if grid.index_created == site_index.created and grid.radius_feet == RADIUS_FEET:
+                        _verdict_grid = grid
+                except Exception as e:
+                    print(f"[WARN] Could not load verdict grid: {e}")
+        return _verdict_grid if _verdict_grid is not None and _verdict_grid.radius_feet == RADIUS_FEET else None
+
+
+def build_verdict_grid(polygon=None):
+    """Classify the county grid from the active site index, persist it and make it active."""
+    global _verdict_grid, _verdict_grid_checked
+    site_index = get_site_index()
+    if site_index is None:
+        raise ValueError("No prohibited site index available; build it first with option 3.")
+    grid = VerdictGrid.build(site_index, polygon or shelby_polygon, RADIUS_FEET)
+    grid.save(verdict_grid_path())
+    grid = VerdictGrid.load(verdict_grid_path())
+    with _site_index_lock:
+        _verdict_grid = grid
+        _verdict_grid_checked = True
+    return grid
+
+
+def get_restaurants_in_counties(fips_list, address=None):
+    """Restaurants across several counties, each tagged with the county_fips it falls in.
+
+    With an address the search radius is fetched once and split between the
+    counties; otherwise each county is fetched within its simplified outer
+    boundary. Points are assigned with CountyRegistry.locate, so the simplified
+    outer/inner boundaries settle most of them without the exact geometry.
+    """
+    if address:
+        lat0, lng0 = geocode_address(address)
+        features = filter(None, map(OsmFeature.from_element,
+                                    iter_overpass_restaurants(lat0, lng0, miles_to_feet(SEARCH_RADIUS_MILES))))
+        batches = [(features, fips_list, (lat0, lng0))]
+    else:
+        batches = []
+        for fips in fips_list:
+            county = county_registry.get(fips)
+            print(f"Fetching restaurants in {county.name} ({fips}) ...")
+            batches.append((iter(query_overpass_county(county.outer)["restaurants"]), [fips],
+                            calculate_polygon_center(county.exact)))
+
+    restaurants = {}
+    for features, batch_fips, (lat0, lng0) in batches:
+        for chunk in iter_chunks(skip_bars(features)):
+            located = county_registry.locate([f.lat for f in chunk], [f.lng for f in chunk], batch_fips)
+            distances = batch_distances_feet(lat0, lng0, [f.lat for f in chunk], [f.lng for f in chunk])
+            for feature, fips, distance in zip(chunk, located, distances):
+                if not fips:
+                    print(f"skipping location that is not in the selected counties: {feature.name}")
+                    continue
+                rest = feature.to_record(distance)
+                rest["county_fips"] = fips
+                restaurants.setdefault(candidate_key(rest), rest)
+
+    print(f"[DEBUG] Total restaurants after filtering: {len(restaurants)}")
+    return sorted(restaurants.values(), key=lambda x: x["distance_feet"])
+
+
+def resolve_addresses(records, workers=None):
+    """Fill in missing "address" values by reverse geocoding the records' coordinates, in parallel.
+
+    Restaurant records leave "address" as None until they are actually shown,
+    so rejected candidates never cost a reverse geocode.
+    """
+    pending = [rec for rec in records if not rec.get("address")]
+    if not pending:
+        return records
+    print(f"Fetching full addresses for {len(pending)} restaurants ...")
+    workers = workers or SCREENING_WORKERS
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        addresses = pool.map(lambda rec: reverse_geocode_clean(rec["lat"], rec["lng"], rec["name"]), pending)
+        for rec, address in zip(pending, addresses):
+            rec["address"] = address
+    return records
+
+
 def calculate_polygon_center(polygon):
     """Calculate approximate geometric center of a polygon by averaging coordinates."""
     try:
+        if polygon.geom_type != "Polygon":
+            # e.g. a county with islands, or a union of counties that do not touch
+            point = polygon.representative_point()
+            return point.y, point.x
         coords = list(polygon.exterior.coords)
         avg_x = sum(x for x, _ in coords) / len(coords)
         avg_y = sum(y for _, y in coords) / len(coords)
@@ -495,104 +3326,1022 @@ def calculate_polygon_center(polygon):
         return (35.1495, -90.0490)
 
 
-def get_restaurants_in_shelby_county(address=None):
+class OsmFeature:
+    """The parts of an Overpass restaurant element that screening needs, without the raw tag dict."""
+
+    __slots__ = ("osm_id", "name", "lat", "lng", "address")
+
+    def __init__(self, osm_id, name, lat, lng, address=None):
+        self.osm_id = osm_id
+        self.name = name
+        self.lat = lat
+        self.lng = lng
+        self.address = address
+
+    @classmethod
+    def from_element(cls, element):
+        """Build from an Overpass element, or return None if it has no name or coordinates."""
+        tags = element.get("tags", {})
+        name = tags.get("name")
+        coords = osm_element_coordinates(element)
+        if not name or not coords:
+            return None
+        # chain names repeat thousands of times across a state
+        return cls(f"{element.get('type', 'node')}/{element.get('id')}", sys.intern(name),
+                   coords[0], coords[1], extract_osm_address(tags))
+
+    def to_record(self, distance_feet):
+        return {"osm_id": self.osm_id, "name": self.name, "address": self.address,
+                "lat": self.lat, "lng": self.lng, "distance_feet": round(float(distance_feet), 1)}
+
+
+BAR_NAME_RE = re.compile(r'\bbar\b', flags=re.IGNORECASE)
+BARBECUE_NAME_RE = re.compile(r'\bbar-b-q\b|\bbar b q\b', flags=re.IGNORECASE)
+
+
+def skip_bars(features):
+    for feature in features:
+        if BAR_NAME_RE.search(feature.name) and not BARBECUE_NAME_RE.search(feature.name):
+            print(f"skipping location that has bar in the name: {feature.name}")
+            continue
+        yield feature
+
+
+def keep_in_polygon(features, polygon):
+    # strict county filter, done up front so out-of-county elements never cost a reverse geocode
+    for chunk in iter_chunks(features):
+        inside = points_in_polygon(polygon, [f.lat for f in chunk], [f.lng for f in chunk])
+        for feature, keep in zip(chunk, inside):
+            if not keep:
+                print(f"skipping location that is not in the county: {feature.name}")
+                continue
+            yield feature
+
+
+def with_distances(features, lat0, lng0):
+    """Pair each feature with its distance in feet from the search center."""
+    for chunk in iter_chunks(features):
+        distances = batch_distances_feet(lat0, lng0, [f.lat for f in chunk], [f.lng for f in chunk])
+        yield from zip(chunk, distances)
+
+
+def get_restaurants_in_shelby_county(address=None, polygon=None):
+    polygon = polygon or shelby_polygon
     if address:
         #print(f"[DEBUG] Using user-provided address: {address}")
         lat0, lng0 = geocode_address(address)
         search_radius_ft = miles_to_feet(SEARCH_RADIUS_MILES)
     else:
         #print("[DEBUG] No address provided, calculating polygon center for Shelby County.")
-        lat0, lng0 = calculate_polygon_center(shelby_polygon)
-        search_radius_ft = miles_to_feet(20)
+        lat0, lng0 = calculate_polygon_center(polygon)
 
     # Fetch nearby restaurants using overpass API since it lets you fetch more than 20 at a time and is free
-    restaurants_raw = query_overpass_restaurants(lat0, lng0, search_radius_ft).get("elements", [])
-    #print("num restaurants returned by overpass search:", len(restaurants_raw))
-    #print("restaurants_raw: ")
-    #print(restaurants_raw)
+    if address:
+        features = filter(None, map(OsmFeature.from_element, iter_overpass_restaurants(lat0, lng0, search_radius_ft)))
+    else:
+        features = iter(query_overpass_county(polygon)["restaurants"])
+
+    # records carry the OSM address if tagged; otherwise it is resolved later (resolve_addresses) only if shown
+    pipeline = with_distances(keep_in_polygon(skip_bars(features), polygon), lat0, lng0)
+    restaurants = [feature.to_record(distance) for feature, distance in pipeline]
+    restaurants.sort(key=lambda x: x["distance_feet"])
 
-    restaurants = []
+    print(f"[DEBUG] Total restaurants after filtering: {len(restaurants)}")
+    return restaurants
 
-    print("Fetching full addresses for " + str(len(restaurants_raw)) + " restaurants found ...")
 
-    processed = -1
-    for element in restaurants_raw:
-        try:
-            processed = processed + 1
-            if processed % 10 == 0 and processed > 0:
-                print("Identified " + str(processed) + " addresses out of " + str(len(restaurants_raw)))
-            #print("current element: ")
-            #print(element)
-            #print("")
-            tags = element.get("tags", {})
-            name = tags.get("name")
-            if not name:
-                continue
-            #print("name: " + name)
 
-            # Coordinates
-            if "lat" in element:
-                lat, lon = element["lat"], element["lon"]
+# ---------------------------
+# COMMAND LINE INTERFACE
+# ---------------------------
+
+RESULT_FIELDS = ["name", "address", "lat", "lng", "safe", "nearest_name", "nearest_distance_feet",
+                 "screened_by", "geocode_disagreement_feet", "geocode_flagged", "error"]
+
+
+class ResultWriter:
+    """Write result records one at a time as JSONL, CSV or a GeoJSON FeatureCollection."""
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        self.count = 0
+        if fmt == "csv":
+            self.csv_writer = csv.DictWriter(stream, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+            self.csv_writer.writeheader()
+        elif fmt == "geojson":
+            stream.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write(self, record):
+        if self.fmt == "csv":
+            self.csv_writer.writerow(record)
+        elif self.fmt == "geojson":
+            geometry = None
+            if record.get("lat") is not None and record.get("lng") is not None:
+                geometry = {"type": "Point", "coordinates": [record["lng"], record["lat"]]}
+            properties = {k: v for k, v in record.items() if k not in ("lat", "lng")}
+            feature = {"type": "Feature", "geometry": geometry, "properties": properties}
+            self.stream.write((",\n" if self.count else "") + json.dumps(feature))
+        else:
+            self.stream.write(json.dumps(record) + "\n")
+        self.count += 1
+        self.stream.flush()
+
+    def close(self):
+        if self.fmt == "geojson":
+            self.stream.write("\n]}\n")
+        self.stream.flush()
+
+
+def ordered_imap(fn, items, workers=None):
+    """Like map(fn, items) but runs on a thread pool, yielding results in input order as they become ready.
+
+    At most a few times `workers` items are in flight, so arbitrarily long
+    inputs are processed in constant memory.
+    """
+    workers = max(1, workers or SCREENING_WORKERS)
+    window = deque()
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            window.append(pool.submit(fn, item))
+            if len(window) >= workers * 4:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def iter_input_records(path):
+    """Yield {"name", "address", "lat", "lng"} dicts from a CSV or JSONL file of addresses or coordinates."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            sample = f.readline()
+            f.seek(0)
+            header = [c.strip().lower() for c in next(csv.reader([sample]), [])]
+            if {"address", "lat", "lng", "lon", "latitude", "longitude"} & set(header):
+                rows = csv.DictReader(f)
             else:
-                center = element.get("center")
-                if not center:
-                    continue
-                lat, lon = center["lat"], center["lon"]
+                rows = ({"address": row[0]} for row in csv.reader(f) if row)
+        for row in rows:
+            row = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+            lat = row.get("lat", row.get("latitude"))
+            lng = row.get("lng", row.get("lon", row.get("longitude")))
+            address = (row.get("address") or "").strip() or None
+            yield {
+                "name": row.get("name") or row.get("id") or address or f"{lat},{lng}",
+                "address": address,
+                "lat": float(lat) if lat not in (None, "") else None,
+                "lng": float(lng) if lng not in (None, "") else None,
+            }
 
-            #print("lat: " + str(lat) + ", lon: " + str(lon))
-            # Distance in feet
-            distance_miles = geodesic([lat0, lng0], (lat, lon)).miles
-            distance_feet = distance_miles * 5280
-            #print("distance_feet: " + str(distance_feet))
 
-            #print("tags for " + name + ": ")
-            #print(tags)
-            address = extract_osm_address(tags) or reverse_geocode_clean(lat, lon, name)
+def check_record(record):
+    """Screen one input record (geocoding it first if it has no coordinates) and return a result record."""
+    result = dict(record)
+    try:
+        if result.get("lat") is None or result.get("lng") is None:
+            geocoded = geocode_address_details(result["address"])
+            result["lat"], result["lng"] = geocoded["coords"]
+            if "disagreement_feet" in geocoded:
+                result["geocode_disagreement_feet"] = geocoded["disagreement_feet"]
+                result["geocode_flagged"] = geocoded["flagged"]
+        places = get_youth_congregation_areas_at(result["lat"], result["lng"])
+        result["safe"] = not places
+        result["places"] = places
+        if places:
+            result["nearest_name"] = places[0]["name"]
+            result["nearest_distance_feet"] = places[0]["distance"]
+    except PlacesBudgetExceeded:
+        raise
+    except Exception as e:
+        result["safe"] = None
+        result["error"] = str(e)
+    return result
 
-            #print("address: " + address)
 
-            # skip bars
-            if re.search(r'\bbar\b', name, flags=re.IGNORECASE) and not re.search(r'\bbar-b-q\b', name, flags=re.IGNORECASE) and not re.search(r'\bbar b q\b', name, flags=re.IGNORECASE):
-                print(f"skipping location that has bar in the name: {name}")
-                continue
+def with_address(record):
+    """Resolve the record's address if the screening left it empty (e.g. a carried-forward or failed check)."""
+    if not record.get("address"):
+        record["address"] = reverse_geocode_clean(record["lat"], record["lng"], record["name"])
+    return record
 
-            #print("checking if location is inside Shelby county")
 
-            # strict Shelby County filter
-            if lat is not None and lon is not None and not inside_shelby_county(lat, lon):
-                print(f"skipping location that is not in Shelby County: {name}")
+def iter_scan_results(address=None, include_all=False, journal=None, resume=False, counties=None):
+    """Screen county restaurants and yield result records as each verdict arrives.
+
+    With a journal every verdict is checkpointed; resume=True reuses the
+    snapshotted candidate list and only screens candidates not yet journaled.
+    """
+    if journal is not None and resume and journal.has_snapshot():
+        restaurants, meta = journal.resume()
+        print(f"[DEBUG] Resuming scan of {len(restaurants)} snapshotted restaurants "
+              f"({len(journal.done)} already checked)")
+    else:
+        restaurants = fetch_restaurants(address, counties)
+        if journal is not None:
+            journal.start(restaurants, {"near": address, "counties": counties})
+
+    try:
+        verdicts = iter_screen_restaurants(restaurants, journal=journal,
+                                           resolve_addresses_for="all" if include_all else "safe")
+        for idx, safe in in_input_order(verdicts):
+            if include_all or safe:
+                yield with_address(dict(restaurants[idx], safe=safe))
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+def current_prohibited_sites(counties=None):
+    """All prohibited sites we know of right now: the site index (if any) plus OSM youth sites in and
+    within RADIUS_FEET of the scanned counties (Shelby County by default)."""
+    if counties:
+        polygon = shapely.union_all([county_registry.get(fips).exact for fips in counties])
+    else:
+        polygon = shelby_polygon
+    sites = {}
+    for site in query_overpass_county(harvest_area(polygon, RADIUS_FEET))["youth_sites"]:
+        sites[site["id"]] = site
+    site_index = get_site_index()
+    if site_index is not None:
+        for site in site_index.sites:
+            sites[site["id"]] = site
+    return sites
+
+
+def incremental_settings():
+    """Settings a carried-forward verdict depends on; a change invalidates the saved state."""
+    return dict(search_settings(), radius_feet=RADIUS_FEET)
+
+
+def plan_incremental_scan(restaurants, sites, previous):
+    """Decide which restaurants need screening given the previous run's state.
+
+    Returns (to_screen, carried) where carried maps candidate keys to the
+    previous verdict records. A restaurant is rescreened if it is new, moved,
+    was safe and is now within RADIUS_FEET of a newly appeared site, or was
+    unsafe and is within RADIUS_FEET of a site that disappeared.
+    """
+    old_restaurants = previous.get("restaurants", {})
+    old_sites = previous.get("sites", {})
+    added_sites = [site for key, site in sites.items() if key not in old_sites]
+    removed_sites = [dict(site, id=key) for key, site in old_sites.items() if key not in sites]
+    added_index = SiteIndex(added_sites) if added_sites else None
+    removed_index = SiteIndex(removed_sites) if removed_sites else None
+
+    to_screen = []
+    carried = {}
+    reasons = {"new": 0, "moved": 0, "new_site_nearby": 0, "removed_site_nearby": 0}
+    for rest in restaurants:
+        key = candidate_key(rest)
+        old = old_restaurants.get(key)
+        if old is None:
+            reasons["new"] += 1
+            to_screen.append(rest)
+            continue
+        moved_feet = float(batch_distances_feet(old["lat"], old["lng"], rest["lat"], rest["lng"]))
+        if moved_feet > INCREMENTAL_MOVE_FEET:
+            reasons["moved"] += 1
+            to_screen.append(rest)
+        elif old["safe"] and added_index is not None and len(added_index.candidates(rest["lat"], rest["lng"], RADIUS_FEET)):
+            reasons["new_site_nearby"] += 1
+            to_screen.append(rest)
+        elif not old["safe"] and removed_index is not None and len(removed_index.candidates(rest["lat"], rest["lng"], RADIUS_FEET)):
+            reasons["removed_site_nearby"] += 1
+            to_screen.append(rest)
+        else:
+            carried[key] = old
+    print(f"[DEBUG] Incremental scan: {len(added_sites)} new and {len(removed_sites)} removed prohibited sites; "
+          f"rescreening {len(to_screen)} of {len(restaurants)} restaurants "
+          f"({', '.join(f'{k}={v}' for k, v in reasons.items())})")
+    return to_screen, carried
+
+
+def iter_incremental_scan_results(address=None, include_all=False, state_path=None, counties=None):
+    """Like iter_scan_results, but carries forward verdicts from the previous run for unchanged restaurants.
+
+    The new state is saved only when the scan completes.
+    """
+    state_path = state_path or INCREMENTAL_STATE_PATH
+    settings = incremental_settings()
+    previous = {}
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if {key: previous.get(key) for key in settings} != settings:
+            print("[WARN] Radius, place types or keywords changed since the last incremental run; "
+                  "rescreening every restaurant.")
+            previous = {}
+
+    restaurants = fetch_restaurants(address, counties)
+    sites = {key: {"name": site["name"], "lat": site["lat"], "lng": site["lng"]}
+             for key, site in current_prohibited_sites(counties).items()}
+    to_screen, carried = plan_incremental_scan(restaurants, sites, previous)
+    rescreen_keys = {candidate_key(rest) for rest in to_screen}
+
+    def verdicts():
+        # carried-forward verdicts are known up front; the rest come from the shared screening pipeline
+        positions = []
+        for idx, rest in enumerate(restaurants):
+            old = carried.get(candidate_key(rest))
+            if candidate_key(rest) in rescreen_keys or old is None:
+                positions.append(idx)
                 continue
+            rest["screened_by"] = "carried_forward"
+            rest["address"] = rest.get("address") or old.get("address")
+            yield idx, old["safe"]
+        for pos, safe in iter_screen_restaurants(to_screen, resolve_addresses_for="all" if include_all else "safe"):
+            yield positions[pos], safe
+
+    new_state = {}
+    for idx, safe in in_input_order(verdicts()):
+        result = dict(restaurants[idx], safe=safe)
+        shown = include_all or safe
+        if shown:
+            with_address(result)
+        new_state[candidate_key(result)] = {"name": result["name"], "lat": result["lat"], "lng": result["lng"],
+                                            "safe": safe, "address": result.get("address")}
+        if shown:
+            yield result
+
+    if len(new_state) < len(restaurants):
+        print("[WARN] Incremental scan stopped early; keeping the previous state.")
+        return
+
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(dict(settings, created=time.time(), near=address, restaurants=new_state, sites=sites), f)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="FindSafeLocations.py",
+        description="Check addresses against locations where minors congregate. "
+                    "Run without arguments for the interactive menu.")
+    parser.add_argument("--radius-feet", type=float, help=f"prohibited radius (default {RADIUS_FEET})")
+    parser.add_argument("--search-radius-miles", type=float,
+                        help=f"restaurant search radius around --near (default {SEARCH_RADIUS_MILES})")
+    parser.add_argument("--types", help="comma-separated Google place types to treat as prohibited")
+    parser.add_argument("--keywords", help="comma-separated name keywords to treat as prohibited")
+    parser.add_argument("--workers", type=int, help=f"concurrent checks (default {SCREENING_WORKERS})")
+    parser.add_argument("--no-hedge", action="store_true", help="query geocoders one at a time instead of racing them")
+    parser.add_argument("--consensus", action="store_true",
+                        help=f"ask every geocoder and flag answers more than {GEOCODE_CONSENSUS_FEET} ft apart")
+    parser.add_argument("--county", action="append", metavar="FIPS",
+                        help="5-digit county FIPS to scan (repeatable; default Shelby County, 47157)")
+    parser.add_argument("--state", metavar="FIPS", help="2-digit state FIPS: scan every county in the state")
+    parser.add_argument("--metrics-json", metavar="PATH", help="write a JSON run summary (stage timings, provider stats)")
+    parser.add_argument("--metrics-prom", metavar="PATH", help="write run metrics as a Prometheus textfile")
+    parser.add_argument("--format", choices=["jsonl", "csv", "geojson"], default="jsonl")
+    parser.add_argument("--output", "-o", help="output file (default: stdout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    check = sub.add_parser("check", help="check a single address or coordinate")
+    check.add_argument("address", nargs="?")
+    check.add_argument("--lat", type=float)
+    check.add_argument("--lng", type=float)
+
+    bulk = sub.add_parser("bulk", help="check every address/coordinate in a CSV or JSONL file")
+    bulk.add_argument("input", help="CSV (address or lat/lng columns) or JSONL file")
+
+    scan = sub.add_parser("scan", help="find county restaurants with no prohibited sites nearby")
+    scan.add_argument("--near", help="only restaurants within --search-radius-miles of this address")
+    scan.add_argument("--all", action="store_true", help="output every restaurant, not just safe ones")
+    scan.add_argument("--journal", default=None,
+                      help="directory for the checkpoint journal (default .cache/scan)")
+    scan.add_argument("--resume", action="store_true",
+                      help="continue the previous scan from its journal instead of starting over")
+    scan.add_argument("--incremental", action="store_true",
+                      help="only rescreen restaurants affected by changes since the last incremental scan")
+
+    sub.add_parser("bench-distances", help="benchmark batch distances against per-pair geodesic")
+
+    ingest = sub.add_parser("ingest-osm", help="build the offline OSM dataset from a local .osm/.osm.pbf extract")
+    ingest.add_argument("path", help=".osm, .osm.bz2, .osm.gz or .osm.pbf file")
+
+    record = sub.add_parser("bench-record", help="record provider responses for the replay benchmark")
+    record.add_argument("fixtures", help="fixture file to write (.json or .json.gz)")
+    record.add_argument("--check", action="append", default=[], metavar="ADDRESS",
+                        help="address to time as an option 1 check (repeatable)")
+    record.add_argument("--scan-near", metavar="ADDRESS", help="address to run an option 2 scan around")
+    record.add_argument("--max-candidates", type=int, default=BENCH_MAX_CANDIDATES)
+
+    replay = sub.add_parser("bench-replay", help="benchmark option 1 and 2 against recorded responses, offline")
+    replay.add_argument("fixtures", nargs="?", default=BENCH_FIXTURES,
+                        help="recorded fixtures (default: the committed smoke workload)")
+    replay.add_argument("--latency-ms", type=float, default=0, help="added latency per upstream request")
+    replay.add_argument("--jitter-ms", type=float, default=0, help="extra uniform random latency")
+    replay.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    replay.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    replay.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s")
+    replay.add_argument("--seed", type=int, default=0)
+    replay.add_argument("--throttled", action="store_true", help="keep PROVIDER_RATE_LIMITS in effect")
+    replay.add_argument("--baseline", help="earlier report to compare against; exit 1 on regression "
+                                           "(default for the smoke workload: its committed baseline)")
+    replay.add_argument("--tolerance", type=float, default=0.2)
+
+    serve_cmd = sub.add_parser("serve", help="run a local HTTP/JSON screening service with warm caches")
+    serve_cmd.add_argument("--host", default=SERVICE_HOST)
+    serve_cmd.add_argument("--port", type=int, default=SERVICE_PORT)
+
+    import_county = sub.add_parser("import-county", help="store a county boundary from a GeoJSON or WKT file")
+    import_county.add_argument("fips")
+    import_county.add_argument("path")
+    import_county.add_argument("--name")
+    return parser
+
+
+def apply_overrides(args):
+    global RADIUS_FEET, SEARCH_RADIUS_MILES, SEARCH_TYPES, SEARCH_KEYWORDS, SCREENING_WORKERS
+    global GEOCODE_HEDGING, GEOCODE_CONSENSUS, METRICS_JSON_PATH, METRICS_PROMETHEUS_PATH
+    if args.radius_feet is not None:
+        RADIUS_FEET = args.radius_feet
+    if args.search_radius_miles is not None:
+        SEARCH_RADIUS_MILES = args.search_radius_miles
+    if args.types:
+        SEARCH_TYPES = [t.strip() for t in args.types.split(",") if t.strip()]
+    if args.keywords is not None:
+        SEARCH_KEYWORDS = [k.strip() for k in args.keywords.split(",") if k.strip()]
+    if args.workers:
+        SCREENING_WORKERS = args.workers
+    if args.no_hedge:
+        GEOCODE_HEDGING = False
+    if args.consensus:
+        GEOCODE_CONSENSUS = True
+    if args.metrics_json:
+        METRICS_JSON_PATH = args.metrics_json
+    if args.metrics_prom:
+        METRICS_PROMETHEUS_PATH = args.metrics_prom
+
+
+def selected_counties(args):
+    """FIPS codes chosen with --county/--state, or None for the default Shelby County polygon."""
+    counties = [f.zfill(5) for f in (args.county or [])]
+    if args.state:
+        counties.extend(county_registry.state_counties(args.state))
+    return sorted(set(counties)) or None
+
+
+def fetch_restaurants(address=None, counties=None):
+    """Restaurants for a scan: the selected counties if any, else Shelby County."""
+    if counties and counties != [DEFAULT_COUNTY_FIPS]:
+        return get_restaurants_in_counties(counties, address)
+    return get_restaurants_in_shelby_county(address)
+
+
+def cli_main(argv):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    apply_overrides(args)
+    try:
+        return run_cli_command(parser, args)
+    finally:
+        write_metrics()
+
+
+def run_cli_command(parser, args):
+    if args.command == "bench-distances":
+        benchmark_distances()
+        return 0
+
+    if args.command == "serve":
+        return serve(args.host, args.port)
+
+    if args.command == "bench-record":
+        if not args.check and not args.scan_near:
+            parser.error("bench-record needs --check and/or --scan-near")
+        return bench_record(args.fixtures, args.check, args.scan_near, args.max_candidates)
+
+    if args.command == "bench-replay":
+        # the committed smoke workload is checked against its committed baseline by default
+        baseline = args.baseline or (BENCH_BASELINE if args.fixtures == BENCH_FIXTURES else None)
+        with contextlib.redirect_stdout(sys.stderr):
+            report = bench_replay(args.fixtures, baseline=baseline, tolerance=args.tolerance,
+                                  unthrottled=not args.throttled, latency_ms=args.latency_ms,
+                                  jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                                  throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed)
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        json.dump(report, out, indent=2)
+        out.write("\n")
+        if out is not sys.stdout:
+            out.close()
+        return 1 if report["regressions"] else 0
+
+    counties = selected_counties(args)
+
+    if args.command == "ingest-osm":
+        polygon = shapely.union_all([county_registry.get(f).exact for f in counties]) if counties else None
+        ingest_osm_extract(args.path, polygon)
+        return 0
+
+    if args.command == "import-county":
+        with open(args.path, encoding="utf-8") as f:
+            text = f.read()
+        if text.lstrip().startswith("{"):
+            data = json.loads(text)
+            if data.get("type") == "FeatureCollection":
+                geom = shapely.union_all([shape(ft["geometry"]) for ft in data["features"]])
+            else:
+                geom = shape(data.get("geometry", data))
+        else:
+            geom = wkt.loads(text)
+        county = county_registry.import_boundary(args.fips.zfill(5), geom, args.name)
+        print(f"Imported {county.name} ({county.fips})", file=sys.stderr)
+        return 0
+
+    if args.command == "check":
+        if args.address is None and (args.lat is None or args.lng is None):
+            parser.error("check needs an address or both --lat and --lng")
+        records = iter([{"name": args.address or f"{args.lat},{args.lng}", "address": args.address,
+                         "lat": args.lat, "lng": args.lng}])
+        results = map(check_record, records)
+    elif args.command == "bulk":
+        results = ordered_imap(check_record, iter_input_records(args.input))
+    elif args.incremental:
+        results = iter_incremental_scan_results(args.near, include_all=args.all, counties=counties)
+    else:
+        results = iter_scan_results(args.near, include_all=args.all,
+                                    journal=ScanJournal(args.journal), resume=args.resume, counties=counties)
 
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    writer = ResultWriter(out, args.format)
+    try:
+        # keep progress/debug prints off stdout when results are streamed there
+        with contextlib.redirect_stdout(sys.stderr):
+            for result in results:
+                writer.write(result)
+            print_geocode_cache_stats()
+            print_places_cost_report()
+    finally:
+        writer.close()
+        if out is not sys.stdout:
+            out.close()
+    return 0
 
-            #print("adding restaurant to list: " + name)
-            restaurants.append({
-                "name": name,
-                "address": address,
-                "distance_feet": round(distance_feet, 1)
-            })
+
+# ---------------------------
+# LOCAL SCREENING SERVICE
+# ---------------------------
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_MAX_BATCH = 500
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key: one caller does the work, the rest wait for its result."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": threading.Event(), "result": None, "error": None}
+            else:
+                self.coalesced += 1
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = fn(*args)
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call["done"].set()
+
+
+_check_flight = SingleFlight()
+_geocode_flight = SingleFlight()
+SERVICE_STATS = {"requests": 0, "checks": 0, "errors": 0, "started": None}
+_service_stats_lock = threading.Lock()
+
+
+def count_service(**increments):
+    with _service_stats_lock:
+        for name, n in increments.items():
+            SERVICE_STATS[name] += n
+
+
+def service_check(record):
+    """check_record for the service: identical in-flight checks (same address or coordinate) run once."""
+    if record.get("lat") is not None and record.get("lng") is not None:
+        key = "pt:" + coordinate_key(record["lat"], record["lng"])
+    else:
+        key = "addr:" + normalize_address_key(record.get("address") or "")
+    key += f"|{RADIUS_FEET}"
+    result = _check_flight.do(key, check_record, {"address": record.get("address"),
+                                                   "lat": record.get("lat"), "lng": record.get("lng")})
+    return dict(result, name=record.get("name") or result.get("name"))
+
+
+def parse_check_request(data):
+    """Normalize one request object ({"address": ...} or {"lat": ..., "lng": ...}) into an input record."""
+    if not isinstance(data, dict):
+        raise ValueError("each check must be a JSON object")
+    lat, lng = data.get("lat"), data.get("lng")
+    if lat is not None and lng is not None:
+        lat, lng = float(lat), float(lng)
+    elif not data.get("address"):
+        raise ValueError("a check needs an address or both lat and lng")
+    return {"name": data.get("name") or data.get("address") or f"{lat},{lng}",
+            "address": data.get("address"), "lat": lat, "lng": lng}
+
+
+class ScreeningRequestHandler(BaseHTTPRequestHandler):
+    """GET /check?address=... or ?lat=..&lng=.., POST /check with one object or a list, GET /health, /stats, /metrics."""
+
+    server_version = "FindSafeLocations/1"
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_checks(self, items, many):
+        count_service(requests=1)
+        try:
+            records = [parse_check_request(item) for item in items]
+        except (ValueError, TypeError) as e:
+            return self.send_json(400, {"error": str(e)})
+        if len(records) > SERVICE_MAX_BATCH:
+            return self.send_json(413, {"error": f"at most {SERVICE_MAX_BATCH} checks per request"})
+        try:
+            results = list(ordered_imap(service_check, iter(records))) if many else [service_check(records[0])]
+        except PlacesBudgetExceeded as e:
+            count_service(errors=1)
+            return self.send_json(503, {"error": str(e)})
+        count_service(checks=len(results), errors=sum(1 for r in results if r.get("error")))
+        self.send_json(200, results if many else results[0])
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            return self.send_json(200, {"ok": True})
+        if url.path == "/metrics":
+            body = METRICS.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if url.path == "/stats":
+            return self.send_json(200, dict(SERVICE_STATS, uptime_seconds=round(time.time() - SERVICE_STATS["started"]),
+                                            coalesced_checks=_check_flight.coalesced,
+                                            coalesced_geocodes=_geocode_flight.coalesced,
+                                            geocode_cache=GEOCODE_CACHE_STATS, places=PLACES_STATS))
+        if url.path == "/check":
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            return self.handle_checks([query], many=False)
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/check":
+            return self.send_json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            return self.send_json(400, {"error": "body must be JSON"})
+        many = isinstance(data, list)
+        self.handle_checks(data if many else [data], many)
+
+    def log_message(self, fmt, *args):
+        print(f"[DEBUG] {self.address_string()} {fmt % args}", file=sys.stderr)
+
+
+def warm_up_service():
+    """Load everything a check needs once, so requests only pay for the lookups themselves."""
+    shapely.prepare(shelby_polygon)
+    _geocode_cache()
+    _places_cache()
+    get_site_index()
+    get_exclusion_zones()
+    get_verdict_grid()
+    get_geocoder("arcgis")
+    get_geocoder("nominatim")
+
+
+def serve(host=None, port=None):
+    """Run the screening service until interrupted."""
+    warm_up_service()
+    server = ThreadingHTTPServer((host or SERVICE_HOST, port or SERVICE_PORT), ScreeningRequestHandler)
+    server.daemon_threads = True
+    SERVICE_STATS["started"] = time.time()
+    print(f"Screening service listening on http://{server.server_address[0]}:{server.server_address[1]}/check",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
 
 
-            #time.sleep(.1)
-            #print("")
+# ---------------------------
+# REPLAY BENCHMARK
+# ---------------------------
+
+BENCH_MAX_CANDIDATES = 200
+# small committed workload for 'bench-replay' (see README); responses come from a synthetic stand-in
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+BENCH_FIXTURES = os.path.join(BENCH_DIR, "smoke.json")
+BENCH_BASELINE = os.path.join(BENCH_DIR, "smoke-baseline.json")
+
+
+def replay_key(method, path, query, body, content_type):
+    """Stable fixture key for an upstream request: API keys dropped, JSON bodies canonicalized,
+    multipart boundaries (which are random per request) replaced by a fixed token."""
+    params = sorted((k, v) for k, v in parse_qs(query, keep_blank_values=True).items() if k.lower() != "key")
+    text = body.decode("utf-8", "replace")
+    if "multipart/form-data" in content_type and "boundary=" in content_type:
+        text = text.replace(content_type.split("boundary=", 1)[1].strip('"'), "BOUNDARY")
+    elif "json" in content_type and text:
+        with contextlib.suppress(ValueError):
+            text = json.dumps(json.loads(text), sort_keys=True)
+    return f"{method} {path}?{json.dumps(params)} {text}"
+
+
+class ReplayServer:
+    """Local stand-in for every provider, served under /<provider>/... on one port.
+
+    In record mode each request is forwarded to the real provider and the
+    response is kept as a fixture; in replay mode fixtures are served back
+    (404 for unknown requests) after the injected latency, with the given
+    fractions of requests answered 429 or 503 instead.
+    """
+
+    def __init__(self, fixtures=None, record=False, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1, seed=0):
+        self.fixtures = fixtures if fixtures is not None else {}
+        self.record = record
+        self.upstream = dict(PROVIDER_BASE_URLS)
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.error_rate, self.throttle_rate = error_rate, throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "served": 0, "missing": 0, "injected_errors": 0, "injected_429s": 0,
+                      "recorded": 0, "by_provider": {}}
+        self.httpd = None
+
+    def respond(self, method, raw_path, headers, body):
+        """Return (status, headers, body bytes) for one request to the stand-in."""
+        url = urlsplit(raw_path)
+        provider, _, rest = url.path.lstrip("/").partition("/")
+        path = "/" + rest
+        key = replay_key(method, f"{provider}{path}", url.query, body, headers.get("Content-Type", ""))
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["by_provider"][provider] = self.stats["by_provider"].get(provider, 0) + 1
+            roll = self.random.random()
+            delay = (self.latency_ms + self.random.uniform(0, self.jitter_ms)) / 1000
+
+        if self.record:
+            target = self.upstream[provider].rstrip("/") + path + (f"?{url.query}" if url.query else "")
+            forward = {k: v for k, v in headers.items()
+                       if k.lower() not in ("host", "content-length", "accept-encoding", "connection")}
+            upstream = requests.request(method, target, headers=forward, data=body, timeout=300)
+            fixture = {"status": upstream.status_code,
+                       "content_type": upstream.headers.get("Content-Type", "application/json"),
+                       "body": upstream.text}
+            if upstream.status_code < 500 and upstream.status_code != 429:
+                with self.lock:
+                    self.fixtures[key] = fixture
+                    self.stats["recorded"] += 1
+            return fixture["status"], {"Content-Type": fixture["content_type"]}, upstream.content
+
+        time.sleep(delay)
+        if roll < self.throttle_rate:
+            with self.lock:
+                self.stats["injected_429s"] += 1
+            return 429, {"Retry-After": str(self.retry_after), "Content-Type": "application/json"}, b'{"error": "throttled"}'
+        if roll < self.throttle_rate + self.error_rate:
+            with self.lock:
+                self.stats["injected_errors"] += 1
+            return 503, {"Content-Type": "application/json"}, b'{"error": "injected failure"}'
+        fixture = self.fixtures.get(key)
+        if fixture is None:
+            with self.lock:
+                self.stats["missing"] += 1
+            return 404, {"Content-Type": "application/json"}, b'{"error": "no recorded response"}'
+        with self.lock:
+            self.stats["served"] += 1
+        return fixture["status"], {"Content-Type": fixture["content_type"]}, fixture["body"].encode("utf-8")
+
+    def start(self):
+        """Serve on an ephemeral local port and point PROVIDER_BASE_URLS at it."""
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_any(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, headers, payload = stand_in.respond(self.command, self.path, dict(self.headers), body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = handle_any
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        for provider in PROVIDER_BASE_URLS:
+            PROVIDER_BASE_URLS[provider] = f"{base}/{provider}"
+        with _geocoders_lock:
+            _geocoders.clear()
+        return base
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        PROVIDER_BASE_URLS.update(self.upstream)
+        with _geocoders_lock:
+            _geocoders.clear()
+
+
+def load_bench_fixtures(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_bench_fixtures(path, data):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path + ".tmp", "wt", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def isolate_bench_state():
+    """Run against an empty temporary cache directory so the real caches and Places budget are untouched.
+
+    Hedged geocoding is turned off: which providers it asks depends on
+    timing, so a replay with injected latency would ask for responses that
+    were never recorded.
+    """
+    global CACHE_DIR, USE_OSM_OFFLINE_DATASET, GEOCODE_HEDGING, GEOCODE_CONSENSUS
+    CACHE_DIR = tempfile.mkdtemp(prefix="findsafe-bench-")
+    USE_OSM_OFFLINE_DATASET = False
+    GEOCODE_HEDGING = False
+    GEOCODE_CONSENSUS = False
+
+
+def run_bench_workload(workload, max_candidates=None):
+    """Time option 1 for each check address and option 2 around the scan address; return the measurements."""
+    report = {"option1": None, "option2": None}
+
+    latencies = []
+    failures = 0
+    for address in workload.get("check_addresses", []):
+        start = time.perf_counter()
+        try:
+            get_youth_congregation_areas(address)
+        except PlacesBudgetExceeded:
+            raise
         except Exception as e:
-            print(e)
-            continue
+            failures += 1
+            print(f"[WARN] option 1 check failed for {address!r}: {e}")
+        latencies.append(time.perf_counter() - start)
+    if latencies:
+        report["option1"] = {"checks": len(latencies), "failures": failures,
+                             "p50_seconds": round(percentile(latencies, 0.5), 4),
+                             "p95_seconds": round(percentile(latencies, 0.95), 4),
+                             "max_seconds": round(max(latencies), 4)}
+
+    near = workload.get("scan_near")
+    if near:
+        calls_before = sum(p["calls"] for p in METRICS.summary()["providers"].values())
+        start = time.perf_counter()
+        restaurants = get_restaurants_in_shelby_county(near)[:max_candidates or BENCH_MAX_CANDIDATES]
+        safe = screen_restaurants(restaurants)
+        resolve_addresses(safe)
+        elapsed = time.perf_counter() - start
+        calls = sum(p["calls"] for p in METRICS.summary()["providers"].values()) - calls_before
+        report["option2"] = {"candidates": len(restaurants), "safe": len(safe), "seconds": round(elapsed, 3),
+                             "candidates_per_second": round(len(restaurants) / elapsed, 3) if elapsed else None,
+                             "upstream_calls": calls,
+                             "calls_per_candidate": round(calls / len(restaurants), 3) if restaurants else None}
+    return report
+
+
+def bench_record(path, check_addresses, scan_near=None, max_candidates=None):
+    """Run the workload against the real providers through the recording stand-in and save the fixtures."""
+    isolate_bench_state()
+    server = ReplayServer(record=True)
+    server.start()
+    workload = {"check_addresses": list(check_addresses), "scan_near": scan_near,
+                "max_candidates": max_candidates or BENCH_MAX_CANDIDATES}
+    try:
+        run_bench_workload(workload, workload["max_candidates"])
+    finally:
+        server.stop()
+    save_bench_fixtures(path, {"recorded": time.time(), "workload": workload, "responses": server.fixtures})
+    print(f"Recorded {len(server.fixtures)} responses to {path}", file=sys.stderr)
+    return 0
 
-    restaurants = sorted(restaurants, key=lambda x: x["distance_feet"])
 
-    print(f"[DEBUG] Total restaurants after filtering: {len(restaurants)}")
-    return restaurants
+def bench_replay(path, baseline=None, tolerance=0.2, unthrottled=True, **injection):
+    """Replay recorded fixtures through the stand-in and report option 1 latency and option 2 throughput.
 
+    With a baseline report, exits non-zero if p95 latency or throughput is
+    more than `tolerance` worse, or calls per candidate went up. Without
+    injected faults, any request with no recorded response is a regression.
+    """
+    global PROVIDER_RATE_LIMITS
+    isolate_bench_state()
+    if unthrottled:
+        PROVIDER_RATE_LIMITS = {}
+    data = load_bench_fixtures(path)
+    server = ReplayServer(fixtures=data["responses"], **injection)
+    server.start()
+    try:
+        report = run_bench_workload(data["workload"], data["workload"].get("max_candidates"))
+    finally:
+        server.stop()
+    report["stand_in"] = server.stats
+    report["injection"] = injection
+    report["metrics"] = METRICS.summary()
+
+    regressions = []
+    if server.stats["missing"] and not (injection.get("error_rate") or injection.get("throttle_rate")):
+        regressions.append(f"{server.stats['missing']} requests had no recorded response")
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            base = json.load(f)
+        old, new = base.get("option1") or {}, report["option1"] or {}
+        if new.get("failures", 0) > old.get("failures", 0):
+            regressions.append(f"option 1 failures {old.get('failures', 0)} -> {new['failures']}")
+        if old.get("p95_seconds") and new.get("p95_seconds", 0) > old["p95_seconds"] * (1 + tolerance):
+            regressions.append(f"option 1 p95 {old['p95_seconds']}s -> {new['p95_seconds']}s")
+        old, new = base.get("option2") or {}, report["option2"] or {}
+        if old.get("candidates_per_second") and \
+                (new.get("candidates_per_second") or 0) < old["candidates_per_second"] * (1 - tolerance):
+            regressions.append(f"option 2 throughput {old['candidates_per_second']} -> "
+                               f"{new.get('candidates_per_second')} candidates/s")
+        if old.get("calls_per_candidate") is not None and \
+                (new.get("calls_per_candidate") or 0) > old["calls_per_candidate"]:
+            regressions.append(f"option 2 calls per candidate {old['calls_per_candidate']} -> "
+                               f"{new.get('calls_per_candidate')}")
+    report["regressions"] = regressions
+    for line in regressions:
+        print(f"[WARN] Regression: {line}", file=sys.stderr)
+    return report
 
 
 # ---------------------------
 # MAIN
 # ---------------------------
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli_main(sys.argv[1:]))
+
     print("Select an option:")
     print("1: Check if an address is near facilities where minors congregate")
     print("2: Find restaurants not near locations where minors congregate")
-    choice = input("Enter 1 or 2: ").strip()
+    print("3: Build/refresh the county-wide index of locations where minors congregate")
+    print("4: Build the safe-area map and verdict grid from the index (exports GeoJSON/WKB)")
+    print("5: Check every address in a CSV file (first column, or a column named 'address')")
+    choice = input("Enter 1, 2, 3, 4 or 5: ").strip()
+
+    site_index = get_site_index()
+    if site_index is not None and choice in ("1", "2"):
+        print(f"[DEBUG] Using local index of {len(site_index.sites)} prohibited sites "
+              f"({site_index.age_days():.1f} days old)")
 
     if choice == "1":
         address = input(f"Enter an address in Shelby County to search within {RADIUS_FEET} feet: ").strip()
@@ -608,9 +4357,16 @@ if __name__ == "__main__":
                 print(f"Distance: {place['distance']} feet\n")
 
     elif choice == "2":
-        address = input("Enter an address in Shelby County to limit search by distance (or leave blank for full county): ").strip()
-
-        restaurants = get_restaurants_in_shelby_county(address)
+        journal = ScanJournal()
+        resumed = False
+        if journal.has_snapshot() and not journal.is_complete():
+            if input("An unfinished scan was found. Resume it? (y/n): ").strip().lower() == "y":
+                restaurants, meta = journal.resume()
+                address = meta.get("near") or ""
+                resumed = True
+        if not resumed:
+            address = input("Enter an address in Shelby County to limit search by distance (or leave blank for full county): ").strip()
+            restaurants = get_restaurants_in_shelby_county(address)
         total_restaurants = len(restaurants)
         if address:
             print(f"\n[WARNING] Found {total_restaurants} restaurants within " + str(SEARCH_RADIUS_MILES) + " miles of the provided address.")
@@ -621,27 +4377,27 @@ if __name__ == "__main__":
         if confirm != "y" and confirm != "Y":
             print("Process cancelled.")
         else:
-            non_kid_friendly = []
-            for i, rest in enumerate(restaurants, 1):
-                #print("checking restaurant: " + rest['name'] + ", address: " + rest['address'])
-                kid_places = get_youth_congregation_areas(rest["address"])
-
-                if not kid_places:
-                    non_kid_friendly.append(rest)
-
-                if i % 10 == 0 or i == total_restaurants:
-                    print(f"[PROGRESS] Checked {i} of {total_restaurants} restaurants…")
+            if not resumed:
+                journal.start(restaurants, {"near": address})
+            try:
+                non_kid_friendly = screen_restaurants(restaurants, journal=journal)
+            finally:
+                journal.close()
 
             # If address was provided, sort non_kid_friendly by distance from that address
             if address:
                 user_lat, user_lng = geocode_address(address)
-                non_kid_friendly.sort(
-                    key=lambda x: geodesic((user_lat, user_lng), geocode_address(x["address"])).feet
-                )
+                user_distances = batch_distances_feet(user_lat, user_lng,
+                                                      [x["lat"] for x in non_kid_friendly],
+                                                      [x["lng"] for x in non_kid_friendly])
+                for rest, dist_ft in zip(non_kid_friendly, user_distances):
+                    rest["distance_from_user_feet"] = float(dist_ft)
+                non_kid_friendly.sort(key=lambda x: x["distance_from_user_feet"])
 
             if not non_kid_friendly:
                 print("\nAll restaurants have kid‑friendly locations nearby.")
             else:
+                resolve_addresses(non_kid_friendly)
                 print(f"\nFound {len(non_kid_friendly)} restaurants with no kid‑friendly locations nearby:\n")
                 for rest in non_kid_friendly:
                     print(f"Restaurant: {rest['name']}")
@@ -650,11 +4406,55 @@ if __name__ == "__main__":
                     #    print(f"Website: {rest['website']}\n")
                     if address:
                         try:
-                            rest_lat, rest_lng = geocode_address(rest["address"])
-                            dist_miles = geodesic((user_lat, user_lng), (rest_lat, rest_lng)).miles
+                            dist_miles = rest["distance_from_user_feet"] / 5280
                             print(f"Distance from provided address: {dist_miles:.2f} miles\n")
                         except Exception as e:
                             print(f"[WARN] Could not calculate distance for {rest['name']}: {e}\n")
 
+    elif choice == "3":
+        sources = ", ".join(SITE_INDEX_SOURCES)
+        confirm = input(f"Harvest all prohibited sites in Shelby County from {sources}? (y/n): ").strip().lower()
+        if confirm != "y":
+            print("Process cancelled.")
+        else:
+            index = build_site_index()
+            print(f"Saved {len(index.sites)} prohibited sites to {site_index_path()}")
+
+    elif choice == "4":
+        zones = build_exclusion_zones()
+        geojson_path = os.path.join(CACHE_DIR, "safe_area.geojson")
+        wkb_path = os.path.join(CACHE_DIR, "safe_area.wkb")
+        zones.export_geojson(geojson_path)
+        zones.export_wkb(wkb_path)
+        print(f"Exported safe area to {geojson_path} and {wkb_path}")
+        build_verdict_grid()
+        print(f"Saved verdict grid to {verdict_grid_path()}")
+
+    elif choice == "5":
+        path = input("Path to CSV file of addresses: ").strip()
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        column = 0
+        if rows and "address" in [c.strip().lower() for c in rows[0]]:
+            column = [c.strip().lower() for c in rows[0]].index("address")
+            rows = rows[1:]
+        addresses = [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+        locations = batch_geocode_addresses(addresses)
+        for address, coords in zip(addresses, locations):
+            if coords is None:
+                print(f"[WARN] Could not geocode: {address}")
+                continue
+            kid_friendly = get_youth_congregation_areas_at(*coords)
+            if kid_friendly:
+                nearest = kid_friendly[0]
+                print(f"NOT SAFE: {address} ({nearest['name']} at {nearest['distance']} feet)")
+            else:
+                print(f"SAFE: {address}")
+
     else:
-        print("Invalid choice. Exiting.")
\ No newline at end of file
+        print("Invalid choice. Exiting.")
+
+    print_geocode_cache_stats()
+    print_places_cost_report()
+    write_metrics()
\ No newline at end of file